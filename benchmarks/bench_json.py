@@ -0,0 +1,53 @@
+"""
+Encode throughput of aviews json backends on lists of models
+
+    $ python benchmarks/bench_json.py [rows] [repeat]
+"""
+import datetime
+import sys
+import timeit
+import uuid
+
+import sqlalchemy as sa
+
+from dvhb_hybrid import aviews
+from dvhb_hybrid.amodels import Model
+
+
+class BenchModel(Model):
+    table = sa.table(
+        'bench',
+        sa.column('id', sa.Integer),
+        sa.column('uuid'),
+        sa.column('title', sa.Text),
+        sa.column('created_at', sa.DateTime),
+        sa.column('meta'),
+    )
+
+
+def make_rows(n):
+    now = datetime.datetime.now()
+    return [
+        BenchModel(
+            id=i,
+            uuid=uuid.uuid4(),
+            title='Заголовок {}'.format(i),
+            created_at=now,
+            meta={'width': 150, 'height': 150, 'tags': ['a', 'b']},
+        )
+        for i in range(n)
+    ]
+
+
+def main(rows=10000, repeat=5):
+    data = make_rows(rows)
+    size = len(aviews.dumps_json(data).encode())
+    print('{} rows, {} bytes'.format(rows, size))
+    for name, dumps in sorted(aviews.json_backends.items()):
+        t = min(timeit.repeat(lambda: dumps(data), number=1, repeat=repeat))
+        print('{:>8}: {:8.2f} ms {:10.0f} rows/s {:8.1f} MB/s'.format(
+            name, t * 1000, rows / t, size / t / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
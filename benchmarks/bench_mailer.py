@@ -0,0 +1,57 @@
+"""
+Messages per second of mailer with the dummy backend
+simulating round trip to server by number of workers
+
+    $ python benchmarks/bench_mailer.py [messages] [latency]
+"""
+import asyncio
+import sys
+import time
+import types
+
+from aiohttp import web
+
+from dvhb_hybrid.mailer.dummy import Mailer
+
+
+def make_message(i):
+    return types.SimpleNamespace(
+        pk=None, mail_to=['user{}@example.com'.format(i)],
+        subject='Subject {}'.format(i), body='Body {}'.format(i))
+
+
+async def bench(loop, workers, messages, latency):
+    app = web.Application(loop=loop)
+    Mailer.setup(app, {
+        'cls': 'dvhb_hybrid.mailer.dummy.Mailer',
+        'from_email': 'no-reply@example.com',
+        'workers': workers,
+        'latency': latency,
+    })
+    await app.startup()
+    mailer = app.mailer
+    mailer.clean()
+    t = time.perf_counter()
+    for i in range(messages):
+        mailer.queue.put_nowait(make_message(i))
+    await mailer.queue.join()
+    t = time.perf_counter() - t
+    assert len(mailer.messages) == messages
+    await mailer.stop()
+    return t
+
+
+def main(messages=500, latency=0.01):
+    loop = asyncio.get_event_loop()
+    print('{} messages, latency {} ms'.format(messages, latency * 1000))
+    base = None
+    for workers in (1, 2, 4, 8, 16):
+        t = loop.run_until_complete(bench(loop, workers, messages, latency))
+        base = base or t
+        print('{:>3} workers: {:8.0f} messages/s  x{:.1f}'.format(
+            workers, messages / t, base / t))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500,
+         float(sys.argv[2]) if len(sys.argv) > 2 else 0.01)
@@ -0,0 +1,60 @@
+"""
+Resize time of imagekit and Pillow engines of files.image_processors.ImageFactory
+
+    $ python benchmarks/bench_resize.py [width] [height] [repeat]
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+import django
+from django.conf import settings
+from django.core.files import File
+
+MEDIA_ROOT = tempfile.mkdtemp()
+settings.configure(MEDIA_ROOT=MEDIA_ROOT, INSTALLED_APPS=['imagekit'])
+django.setup()
+
+from PIL import Image  # noqa
+
+from dvhb_hybrid.files import image_processors  # noqa
+
+NAME = 'image/ab/cd/abcd1234-aaaa-4bbb-8ccc-123456789012.jpg'
+
+
+def make_source(width, height):
+    path = os.path.join(MEDIA_ROOT, NAME)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    noise = Image.effect_noise((width, height), 60).convert('RGB')
+    gradient = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    Image.blend(gradient, noise, 0.3).save(path, quality=90)
+    return path
+
+
+def imagekit_resize(factory, path, w, h):
+    with open(path, 'rb') as f:
+        source = File(f, name=NAME)
+        content = factory.get_generator(w, h)(source=source).generate()
+    destination = os.path.join(MEDIA_ROOT, factory.get_cachefile_name(NAME, w, h))
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    with open(destination, 'wb') as f:
+        f.write(content.read())
+
+
+def main(width=3000, height=2000, repeat=10):
+    path = make_source(width, height)
+    imagekit = image_processors.ImageFactory()
+    pillow = image_processors.ImageFactory(engine=image_processors.ENGINE_PILLOW)
+    print('source {}x{}'.format(width, height))
+    for w, h in ((150, 150), (300, 300)):
+        t1 = min(timeit.repeat(
+            lambda: imagekit_resize(imagekit, path, w, h), number=1, repeat=repeat))
+        t2 = min(timeit.repeat(
+            lambda: pillow.resize_to_cache(NAME, w, h, MEDIA_ROOT), number=1, repeat=repeat))
+        print('{:>4}x{:<4} imagekit {:7.1f} ms  pillow {:7.1f} ms  x{:.1f}'.format(
+            w, h, t1 * 1000, t2 * 1000, t1 / t2))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
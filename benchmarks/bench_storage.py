@@ -0,0 +1,48 @@
+"""
+Saves per second of files.storages.ImageStorage
+with default directories and with pre-created shard directories
+
+    $ python benchmarks/bench_storage.py [saves] [size]
+"""
+import shutil
+import sys
+import tempfile
+import time
+
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+settings.configure()
+django.setup()
+
+from dvhb_hybrid.files.storages import ImageStorage  # noqa
+
+
+def bench(storage, data, saves):
+    t = time.perf_counter()
+    for _ in range(saves):
+        storage.save('photo.jpg', ContentFile(data))
+    return time.perf_counter() - t
+
+
+def main(saves=20000, size=4096):
+    data = b'\xff\xd8\xff' + bytes(size - 3)
+    for precreate in (False, True):
+        settings.FILES_PRECREATE_SHARDS = precreate
+        root = tempfile.mkdtemp()
+        try:
+            storage = ImageStorage(location=root)
+            if precreate:
+                t = time.perf_counter()
+                storage.ensure_shards()
+                print('shards created in {:.2f} s'.format(time.perf_counter() - t))
+            t = bench(storage, data, saves)
+        finally:
+            shutil.rmtree(root)
+        print('{:>10}: {:8.0f} saves/s {:8.1f} us/save'.format(
+            'precreated' if precreate else 'default', saves / t, t / saves * 1e6))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -1,3 +1,6 @@
+import logging
+import time
+
 from .convert import derive_from_django
 from .decorators import method_connect_once, method_redis_once
 from .model import Model
@@ -12,6 +15,8 @@ __all__ = [
     'method_redis_once'
 ]
 
+logger = logging.getLogger(__name__)
+
 
 class AppModels:
     """
@@ -36,6 +41,32 @@ class AppModels:
             return sub_class
         raise AttributeError('%r has no attribute %r' % (self, item))
 
+    def warm_up(self):
+        """
+        Builds all registered models with their relationships
+        to avoid doing it on the first access during request handling.
+
+        Abstract models (without table) are skipped.
+        Returns dict of model name => seconds spent
+        """
+        timings = {}
+        total = time.monotonic()
+        for name, model_cls in sorted(Model.models.items()):
+            if name in self.__dict__ or getattr(model_cls, 'table', None) is None:
+                continue
+            start = time.monotonic()
+            try:
+                getattr(self, name)
+            except Exception:
+                logger.exception('Warm up of model %r failed', name)
+                continue
+            timings[name] = time.monotonic() - start
+            logger.debug('Model %r warmed up in %.6fs', name, timings[name])
+        logger.info(
+            'Warmed up %d models in %.6fs',
+            len(timings), time.monotonic() - total)
+        return timings
+
     @staticmethod
     def import_all_models(apps_path):
         """Imports all the models from apps_path"""
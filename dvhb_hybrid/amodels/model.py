@@ -1,5 +1,5 @@
+import collections
 import itertools
-import json
 import uuid
 
 from abc import ABCMeta
@@ -9,6 +9,8 @@ from operator import and_
 import sqlalchemy as sa
 
 from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.base import Executable
 from sqlalchemy.sql.elements import ClauseElement
 from sqlalchemy import func
 
@@ -18,6 +20,7 @@ except ImportError:
     dtrans = None
 
 
+from .debug import ConnectionLogger
 from .decorators import method_connect_once, method_redis_once
 from .. import utils, exceptions, aviews
 
@@ -45,6 +48,7 @@ class Model(dict, metaclass=MetaModel):
     fields_list = ()
     fields_one = None
     fields_localized = None
+    response_cache_tags = ()  # Tags of cached responses to invalidate on write
 
     @classmethod
     def factory(cls, app):
@@ -70,7 +74,7 @@ class Model(dict, metaclass=MetaModel):
         return obj
 
     def pretty(self):
-        return json.dumps(self, indent=3, cls=aviews.JsonEncoder)
+        return aviews.dumper(self, indent=3)
 
     @property
     def pk(self):
@@ -160,11 +164,8 @@ class Model(dict, metaclass=MetaModel):
             dict.update(self, r)
 
     @classmethod
-    @method_connect_once
-    async def get_list(cls, *args, connection, fields=None,
-                       offset=None, limit=None, sort=None,
-                       select_from=None):
-        """Extract list"""
+    def _get_list_sql(cls, *args, fields=None, offset=None, limit=None,
+                      sort=None, select_from=None):
         if fields:
             fields = cls.to_column(fields)
         elif cls.fields_list:
@@ -191,13 +192,65 @@ class Model(dict, metaclass=MetaModel):
             sql = sql.order_by(sort)
         elif sort:
             sql = sql.order_by(*sort)
+        return sql
 
+    @classmethod
+    @method_connect_once
+    async def get_list(cls, *args, connection, fields=None,
+                       offset=None, limit=None, sort=None,
+                       select_from=None):
+        """Extract list"""
+        sql = cls._get_list_sql(
+            *args, fields=fields, offset=offset, limit=limit,
+            sort=sort, select_from=select_from)
         result = await connection.execute(sql)
         l = []
         async for row in result:
             l.append(cls(**row))
         return l
 
+    @classmethod
+    def get_list_cursor(cls, *args, connection=None, chunk_size=1000, **kwargs):
+        """
+        Extract list through server-side cursor fetching chunk_size rows at once.
+        Takes the same arguments as get_list.
+
+        .. code-block::python
+
+            async with Model.get_list_cursor(sort='id') as cursor:
+                async for obj in cursor:
+                    ...
+
+        """
+        sql = cls._get_list_sql(*args, **kwargs)
+        return ListCursor(cls, sql, connection=connection, chunk_size=chunk_size)
+
+    def get_etag(self):
+        """
+        Returns ETag of object from primary key and updated_at
+        or from all its data if there is no updated_at
+        """
+        if self.get('updated_at') is not None:
+            return utils.make_etag(type(self).__name__, self.pk, self['updated_at'])
+        return utils.make_etag(type(self).__name__, self.copy_object())
+
+    @classmethod
+    @method_connect_once
+    async def get_list_etag(cls, *args, connection=None):
+        """
+        Returns ETag of rows matching args
+        from count(*) and max(updated_at) without loading rows
+        """
+        columns = [func.count()]
+        if 'updated_at' in cls.table.c:
+            columns.append(func.max(cls.table.c.updated_at))
+        sql = sa.select(columns).select_from(cls.table)
+        if args and args[0] is not None:
+            sql = sql.where(reduce(and_, args))
+        result = await connection.execute(sql)
+        row = await result.first()
+        return utils.make_etag(cls.__name__, _hash_stmt(sql), *row)
+
     @classmethod
     @method_connect_once
     async def get_dict(cls, *where_and, connection=None,
@@ -311,6 +364,7 @@ class Model(dict, metaclass=MetaModel):
         uid = await connection.scalar(
             cls.table.insert().returning(pk).values(kwargs))
         kwargs[cls.primary_key] = uid
+        await cls.invalidate_response_cache()
         return cls(**kwargs)
 
     @classmethod
@@ -338,6 +392,7 @@ class Model(dict, metaclass=MetaModel):
             pk = await connection.scalar(
                 self.table.insert().returning(pk_field).values(self))
             self[self.primary_key] = pk
+            await self.invalidate_response_cache()
             return pk
         if fields:
             fields = list(itertools.chain(fields, self.fields_permanent))
@@ -355,6 +410,7 @@ class Model(dict, metaclass=MetaModel):
             .values(values)
         )
         assert self.pk == pk
+        await self.invalidate_response_cache()
 
         return pk
 
@@ -371,6 +427,7 @@ class Model(dict, metaclass=MetaModel):
             t.update().where(
                 t.c[self.primary_key] == self.pk
             ).values(dict_update))
+        await self.invalidate_response_cache()
 
     @classmethod
     @method_connect_once
@@ -386,6 +443,7 @@ class Model(dict, metaclass=MetaModel):
             t.update().
             where(where).
             values(dict_update))
+        await cls.invalidate_response_cache()
 
     @method_connect_once
     async def update_json(self, *args, connection=None, **kwargs):
@@ -413,6 +471,7 @@ class Model(dict, metaclass=MetaModel):
                     for field, value in kwargs.items()
                 }
             ).returning(t.c[self.primary_key]))
+        await self.invalidate_response_cache()
 
     @classmethod
     @method_connect_once
@@ -423,11 +482,13 @@ class Model(dict, metaclass=MetaModel):
 
         await connection.execute(
             t.delete().where(*where))
+        await cls.invalidate_response_cache()
 
     @method_connect_once
     async def delete(self, connection=None):
         pk_field = self.table.c[self.primary_key]
         await connection.execute(self.table.delete().where(pk_field == self.pk))
+        await self.invalidate_response_cache()
 
     @classmethod
     @method_connect_once
@@ -447,8 +508,16 @@ class Model(dict, metaclass=MetaModel):
             cls.table.insert().returning(pk_field).values(defaults))
         obj = cls(**defaults)
         obj.pk = pk
+        await cls.invalidate_response_cache()
         return obj, True
 
+    @classmethod
+    async def invalidate_response_cache(cls):
+        """Invalidates responses cached with response_cache_tags"""
+        if cls.response_cache_tags:
+            from ..cache import invalidate_tags
+            await invalidate_tags(cls.app, *cls.response_cache_tags)
+
     @classmethod
     def validate(cls, data, to_class=True, default_validator=True):
         """Returns valid object or exception"""
@@ -497,6 +566,71 @@ class Model(dict, metaclass=MetaModel):
                 obj[field] = value
 
 
+class DeclareCursor(Executable, ClauseElement):
+    """DECLARE statement for server-side cursor"""
+    def __init__(self, name, select):
+        self.name = name
+        self.select = select
+
+
+@compiles(DeclareCursor)
+def _compile_declare_cursor(element, compiler, **kwargs):
+    return 'DECLARE {} NO SCROLL CURSOR FOR {}'.format(
+        element.name, compiler.process(element.select, **kwargs))
+
+
+class ListCursor:
+    """
+    Asynchronous iterator over server-side cursor.
+    Holds connection and transaction until exit from context.
+    """
+    def __init__(self, model, sql, *, connection=None, chunk_size=1000):
+        self.model = model
+        self.sql = sql
+        self.chunk_size = chunk_size
+        self.name = 'cursor_' + uuid.uuid4().hex
+        self._connection = connection
+        self._acquire = None
+        self._transaction = None
+        self._rows = collections.deque()
+        self._exhausted = False
+
+    async def __aenter__(self):
+        if self._connection is None:
+            self._acquire = self.model.app['db'].acquire()
+            self._connection = ConnectionLogger(await self._acquire.__aenter__())
+        self._transaction = await self._connection.begin()
+        await self._connection.execute(DeclareCursor(self.name, self.sql))
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is None:
+                await self._transaction.commit()
+            else:
+                await self._transaction.rollback()
+        finally:
+            if self._acquire is not None:
+                await self._acquire.__aexit__(exc_type, exc_val, exc_tb)
+                self._connection = self._acquire = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._rows:
+            if self._exhausted:
+                raise StopAsyncIteration
+            result = await self._connection.execute(
+                'FETCH FORWARD {} FROM {}'.format(self.chunk_size, self.name))
+            self._rows.extend(await result.fetchall())
+            if len(self._rows) < self.chunk_size:
+                self._exhausted = True
+            if not self._rows:
+                raise StopAsyncIteration
+        return self.model(**self._rows.popleft())
+
+
 def _hash_stmt(stmt):
     compiled = stmt.compile()
     msg = compiled.string + repr(compiled.params)
@@ -1,5 +1,4 @@
 import datetime
-import functools
 import json
 import uuid
 
@@ -8,6 +7,11 @@ from aiohttp_apiset.views import ApiSet
 
 from .redis import RedisMixin
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 class JsonEncoder(json.JSONEncoder):
     ensure_ascii = False
@@ -30,8 +34,144 @@ class JsonEncoder(json.JSONEncoder):
             return super(JsonEncoder, self).default(o)
 
 
-dumper = functools.partial(
-    json.dumps, ensure_ascii=False, cls=JsonEncoder)
+def dumps_json(data, **kwargs):
+    """Serializes data using stdlib json module"""
+    kwargs.setdefault('ensure_ascii', JsonEncoder.ensure_ascii)
+    kwargs.setdefault('cls', JsonEncoder)
+    return json.dumps(data, **kwargs)
+
+
+def _orjson_default(o):
+    # date, datetime and UUID are serialized by orjson itself
+    if isinstance(o, (map, set, frozenset)):
+        return list(o)
+    raise TypeError('Type is not JSON serializable: %s' % type(o).__name__)
+
+
+def dumps_orjson(data, *, indent=None, sort_keys=False, **kwargs):
+    """
+    Serializes data using orjson.
+    Falls back to stdlib json for options orjson does not support
+    (indent is always 2 spaces) and for data it can not serialize
+    """
+    if kwargs.pop('ensure_ascii', False) or kwargs:
+        return dumps_json(data, indent=indent, sort_keys=sort_keys, **kwargs)
+    option = orjson.OPT_NON_STR_KEYS
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    try:
+        return orjson.dumps(data, default=_orjson_default, option=option).decode()
+    except TypeError:
+        return dumps_json(data, indent=indent, sort_keys=sort_keys)
+
+
+json_backends = {
+    'json': dumps_json,
+}
+if orjson is not None:
+    json_backends['orjson'] = dumps_orjson
+
+_dumps = json_backends.get('orjson', dumps_json)
+
+
+def set_json_backend(name):
+    """Selects the serializer used by dumper, one of json_backends"""
+    global _dumps
+    _dumps = json_backends[name]
+
+
+def dumper(data, **kwargs):
+    return _dumps(data, **kwargs)
+
+
+class JsonStreamResponse(web.StreamResponse):
+    """
+    Response writing JSON array (or NDJSON) incrementally
+    with chunked encoding, at most buffer_size bytes are buffered.
+
+    .. code-block::python
+
+        async with app.m.user.get_list_cursor(sort='id') as cursor:
+            return await stream_json(request, cursor)
+
+    """
+    def __init__(self, *args, ndjson=False, buffer_size=2 ** 16,
+                 dumps=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ndjson = ndjson
+        self.buffer_size = buffer_size
+        self.dumps = dumps or dumper
+        if ndjson:
+            self.content_type = 'application/x-ndjson'
+        else:
+            self.content_type = 'application/json'
+        self.charset = 'utf-8'
+        self.enable_chunked_encoding()
+
+    async def write_items(self, items):
+        """Writes all items from iterable or asynchronous iterable"""
+        if self.ndjson:
+            start, sep, end = b'', b'\n', b'\n'
+        else:
+            start, sep, end = b'[', b',', b']'
+        buf = bytearray(start)
+        first = True
+
+        async def push(item):
+            nonlocal first
+            if first:
+                first = False
+            else:
+                buf.extend(sep)
+            buf.extend(self.dumps(item).encode())
+            if len(buf) >= self.buffer_size:
+                await self.write(bytes(buf))
+                buf.clear()
+
+        if hasattr(items, '__aiter__'):
+            async for item in items:
+                await push(item)
+        else:
+            for item in items:
+                await push(item)
+        if not self.ndjson or not first:
+            buf.extend(end)
+        if buf:
+            await self.write(bytes(buf))
+
+
+async def stream_json(request, items, **kwargs):
+    """Streams items as JSON array, see JsonStreamResponse"""
+    response = JsonStreamResponse(**kwargs)
+    await response.prepare(request)
+    await response.write_items(items)
+    await response.write_eof()
+    return response
+
+
+def etag_matches(request, etag):
+    """Checks If-None-Match header of request against ETag using weak comparison"""
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    etag = etag[2:] if etag.startswith('W/') else etag
+    for i in header.split(','):
+        i = i.strip()
+        if i == '*':
+            return True
+        elif i.startswith('W/'):
+            i = i[2:]
+        if i == etag:
+            return True
+    return False
+
+
+def check_etag(request, etag):
+    """Raises 304 Not Modified when client has actual version"""
+    if etag_matches(request, etag):
+        raise web.HTTPNotModified(headers={'ETag': etag})
 
 
 class BaseView(RedisMixin, ApiSet):
@@ -50,6 +190,12 @@ class BaseView(RedisMixin, ApiSet):
         elif request.content_length > limit:
             raise self.response(status=413)
 
+    def check_etag(self, etag):
+        check_etag(self.request, etag)
+
+    def stream_json(self, items, **kwargs):
+        return stream_json(self.request, items, **kwargs)
+
     def list_params(self, data: dict, limit=10, offset=0):
         try:
             limit = int(data.get('limit'))
@@ -66,8 +212,9 @@ class BaseView(RedisMixin, ApiSet):
         return limit, offset
 
 
-def response_file(url, mime_type, filename=None):
-    headers = {'X-Accel-Redirect': url}
+def response_file(url, mime_type, filename=None, headers=None):
+    headers = dict(headers or {})
+    headers['X-Accel-Redirect'] = url
     if filename:
         v = 'attachment; filename="{}"'.format(filename)
         headers['Content-Disposition'] = v
@@ -77,5 +224,19 @@ def response_file(url, mime_type, filename=None):
     )
 
 
+def file_response(path, mime_type=None, filename=None, headers=None):
+    """
+    Streams file by aiohttp with sendfile when available,
+    Range and If-Modified-Since requests are supported
+    """
+    headers = dict(headers or {})
+    if mime_type:
+        headers['Content-Type'] = mime_type
+    if filename:
+        v = 'attachment; filename="{}"'.format(filename)
+        headers['Content-Disposition'] = v
+    return web.FileResponse(path, headers=headers)
+
+
 async def http200(request):
     raise web.HTTPOk(body=b'')
@@ -0,0 +1,325 @@
+import asyncio
+import collections
+import functools
+import json
+import time
+
+from aiohttp import web
+
+from . import utils
+from .aviews import check_etag, dumper
+from .permissions import get_api_key, get_request_from_args
+from .redis import redis_key
+
+VARY_QUERY = 'query'
+VARY_LOCALE = 'locale'
+VARY_USER = 'user'
+
+NAMESPACE = 'response'
+NAMESPACE_TAG = 'response_tag'
+
+# Skip caching of responses with these headers
+NOT_CACHED_HEADERS = ('Set-Cookie',)
+# Do not store these headers, they are set again by aiohttp
+SKIP_HEADERS = ('Content-Length', 'Date', 'Server', 'Transfer-Encoding')
+
+_in_flight = {}
+
+MISSING = object()
+
+
+def _get_prefix(app):
+    return getattr(app, 'name', None)
+
+
+def get_cache_key(request, name, vary_on=()):
+    """
+    Generates cache key for handler name from request path
+    and request values listed in vary_on
+    """
+    data = [request.method, request.rel_url.path]
+    for i in vary_on:
+        if i == VARY_QUERY:
+            data.append(sorted(request.query.items()))
+        elif i == VARY_LOCALE:
+            data.append(str(request.get('locale', '')))
+        elif i == VARY_USER:
+            user = getattr(request, 'user', None)
+            if user is not None and user.pk is not None:
+                data.append(['user', user.pk])
+            else:
+                data.append(['api_key', get_api_key(request)])
+        else:
+            raise ValueError('Unknown vary_on value {!r}'.format(i))
+    return redis_key(_get_prefix(request.app), utils.hash_data(data), NAMESPACE, name)
+
+
+def _get_tag_key(app, tag):
+    return redis_key(_get_prefix(app), tag, NAMESPACE_TAG)
+
+
+def _to_cached(result):
+    """Returns (status, headers, body) or None when result can not be cached"""
+    if isinstance(result, web.StreamResponse):
+        if not isinstance(result, web.Response) or result.body is None:
+            return
+        elif result.status != web.HTTPOk.status_code:
+            return
+        elif any(i in result.headers for i in NOT_CACHED_HEADERS):
+            return
+        headers = {
+            k: v for k, v in result.headers.items()
+            if k not in SKIP_HEADERS
+        }
+        body = result.body
+        if not isinstance(body, bytes):
+            return
+        return result.status, headers, body
+    body = dumper(result).encode()
+    headers = {'Content-Type': 'application/json; charset=utf-8'}
+    return web.HTTPOk.status_code, headers, body
+
+
+def _to_response(cached):
+    status, headers, body = cached
+    return web.Response(status=status, headers=headers, body=body)
+
+
+async def _get(redis, key):
+    data = await redis.hgetall(key)
+    if not data or b'body' not in data:
+        return
+    return (
+        int(data[b'status']),
+        json.loads(data[b'headers'].decode()),
+        data[b'body'],
+    )
+
+
+async def _set(redis, app, key, cached, ttl, tags):
+    status, headers, body = cached
+    await redis.hmset(
+        key,
+        'status', status,
+        'headers', json.dumps(headers),
+        'body', body)
+    await redis.expire(key, ttl)
+    for tag in tags:
+        tag_key = _get_tag_key(app, tag)
+        await redis.sadd(tag_key, key)
+        # Tag lives not less than the longest of its responses
+        if await redis.ttl(tag_key) < ttl:
+            await redis.expire(tag_key, ttl)
+
+
+async def invalidate_tags(app, *tags, redis=None):
+    """Deletes all cached responses marked with tags"""
+    if not tags:
+        return
+    elif redis is None:
+        async with app['redis'].get() as redis:
+            return await invalidate_tags(app, *tags, redis=redis)
+    for tag in tags:
+        tag_key = _get_tag_key(app, tag)
+        keys = await redis.smembers(tag_key)
+        await redis.delete(tag_key, *keys)
+
+
+def cached_response(ttl, vary_on=(), tags=(), redis='redis'):
+    """
+    Decorator to cache serialized response of handler in Redis.
+
+    Concurrent misses in one process wait for single handler call.
+    Responses other than 200 OK are not cached.
+
+    :param ttl: Seconds to keep response
+    :param vary_on: Values of request response depends on,
+        any of VARY_QUERY, VARY_LOCALE, VARY_USER.
+        Path is always taken into account.
+        Decorate handler after @permissions to vary on user id,
+        otherwise API key is used.
+    :param tags: Tags to invalidate responses by, see invalidate_tags
+    :param redis: Key of redis pool in application
+
+    .. code-block::python
+
+        @cached_response(60, vary_on=[VARY_QUERY, VARY_LOCALE], tags=['image'])
+        async def get_images(request, limit=10):
+            ...
+
+    """
+    def with_arg(view):
+        name = '{}.{}'.format(view.__module__, view.__qualname__)
+
+        @functools.wraps(view)
+        async def wrapper(*args, **kwargs):
+            request = get_request_from_args(args, kwargs)
+            app = request.app
+            key = get_cache_key(request, name, vary_on)
+
+            async with app[redis].get() as connection:
+                cached = await _get(connection, key)
+            if cached:
+                return _to_response(cached)
+
+            f = _in_flight.get(key)
+            if f is not None:
+                cached = await asyncio.shield(f)
+                if cached:
+                    return _to_response(cached)
+                # Leader failed or response can not be cached
+                return await view(*args, **kwargs)
+
+            f = _in_flight[key] = asyncio.Future(loop=app.loop)
+            cached = None
+            try:
+                result = await view(*args, **kwargs)
+                cached = _to_cached(result)
+                if cached is None:
+                    return result
+                async with app[redis].get() as connection:
+                    await _set(connection, app, key, cached, ttl, tags)
+                return _to_response(cached)
+            finally:
+                del _in_flight[key]
+                f.set_result(cached)
+
+        return wrapper
+    return with_arg
+
+
+def conditional(get_etag):
+    """
+    Decorator to support conditional GET.
+    Calls get_etag with arguments of handler to compute ETag
+    and responds 304 Not Modified before calling handler
+    when If-None-Match matches it. Otherwise sets ETag header.
+
+    .. code-block::python
+
+        @conditional(lambda request, **kwargs: request.app.m.image.get_list_etag())
+        async def get_images(request, limit=10):
+            ...
+
+    """
+    def with_arg(view):
+        @functools.wraps(view)
+        async def wrapper(*args, **kwargs):
+            request = get_request_from_args(args, kwargs)
+            etag = get_etag(*args, **kwargs)
+            if asyncio.iscoroutine(etag):
+                etag = await etag
+            check_etag(request, etag)
+            result = await view(*args, **kwargs)
+            if not isinstance(result, web.StreamResponse):
+                result = web.Response(
+                    body=dumper(result).encode(),
+                    content_type='application/json')
+            if not result.prepared:
+                result.headers['ETag'] = etag
+            return result
+        return wrapper
+    return with_arg
+
+
+class LRUCache:
+    """
+    In-process cache limited by number of entries and time to live.
+    Least recently used entries are evicted when maxsize is reached.
+
+    >>> c = LRUCache(maxsize=2, ttl=60)
+    >>> c.set('a', 1); c.set('b', None); c.set('c', 3)
+    >>> c.get('a') is MISSING, c.get('b'), c.get('c'), c.evictions
+    (True, None, 3, 1)
+    """
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=MISSING):
+        """Returns cached value or default"""
+        item = self._data.get(key)
+        if item is not None:
+            value, expires = item
+            if expires is None or expires > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return default
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+        expires = time.monotonic() + ttl if ttl is not None else None
+        self._data[key] = value, expires
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+
+class BatchLoader:
+    """
+    Coalesces loads of keys requested within delay seconds
+    into one call of coroutine function load(keys),
+    which returns dict of found values by key.
+    Futures of keys missing in result are resolved with None.
+    """
+    def __init__(self, load, delay=0.002, max_size=100, loop=None):
+        self.load = load
+        self.delay = delay
+        self.max_size = max_size
+        self.loop = loop or asyncio.get_event_loop()
+        self._pending = {}
+        self._handle = None
+
+    def get(self, key):
+        """Returns future of value of key"""
+        f = self._pending.get(key)
+        if f is None:
+            f = self._pending[key] = self.loop.create_future()
+            if len(self._pending) >= self.max_size:
+                self.flush()
+            elif self._handle is None:
+                self._handle = self.loop.call_later(self.delay, self.flush)
+        return f
+
+    def flush(self):
+        """Starts load of pending keys"""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            asyncio.ensure_future(self._load(batch), loop=self.loop)
+
+    async def _load(self, batch):
+        try:
+            result = await self.load(list(batch))
+        except BaseException as e:
+            # Waiters of cancelled load are failed too, not left hanging
+            for f in batch.values():
+                if not f.done():
+                    f.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            # Error is delivered to waiters, not logged by unawaited task
+            return
+        for key, f in batch.items():
+            if not f.done():
+                f.set_result(result.get(key))
@@ -76,11 +76,22 @@ cleanup_ctx_redis_sessions = functools.partial(
     cleanup_ctx_redis, app_key='sessions', cfg_key='sessions')
 
 
+async def cleanup_ctx_client_session(app, app_key='client_session', limit=100):
+    import aiohttp
+    session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=limit, loop=app.loop),
+        loop=app.loop)
+    app[app_key] = session
+    yield
+    await session.close()
+
+
 async def cleanup_ctx_databases(app, cfg_key='default', app_key='db'):
     import asyncpgsa
     from dvhb_hybrid.amodels import AppModels
     dbparams = app.context.config.databases.get(cfg_key)
     app.models = app.m = AppModels(app)
+    app.m.warm_up()
     async with asyncpgsa.create_pool(**dbparams) as pool:
         app[app_key] = pool
         yield
@@ -2,12 +2,10 @@
 DEPRECATED module. Use aiohttp.web_exceptions instead
 """
 
-import json
-
 import aiohttp.web
 from aiohttp.web_exceptions import HTTPException
 
-from .aviews import JsonEncoder
+from .aviews import dumper
 
 
 DEFAULT_CONTENT_TYPE = 'application/json;charset=utf-8'
@@ -29,11 +27,7 @@ class JsonHTTPException:
     def body(self):
         if self._body:
             return self._body
-        self._body = json.dumps(
-            self.as_dict(),
-            cls=JsonEncoder,
-            ensure_ascii=False,
-            indent=3).encode()
+        self._body = dumper(self.as_dict(), indent=3).encode()
         return self._body
 
     @body.setter
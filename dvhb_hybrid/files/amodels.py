@@ -1,13 +1,25 @@
+import hashlib
+import logging
 import mimetypes
-from io import BytesIO
+import tempfile
 
 from aiohttp import client
+from django.conf import settings
 from sqlalchemy import table, column
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 
 from ..amodels import Model
 from .. import utils
+from . import image, image_processors
+from .astorages import get_storage
 from .storages import image_storage
+from .utils import SNIFF_SIZE, sniff_image_type
+
+logger = logging.getLogger(__name__)
+
+
+def dedup_enabled():
+    return getattr(settings, 'FILES_DEDUP', False)
 
 
 class Image(Model):
@@ -29,37 +41,79 @@ class Image(Model):
         data['updated_at'] = utils.now()
 
     @classmethod
-    async def from_url(cls, url, *, user, connection=None):
-        async with client.ClientSession() as session:
+    async def from_url(cls, url, *, user, connection=None, session=None):
+        """
+        Downloads image from url to temporary file and saves it.
+        Returns None when response is not an image or exceeds
+        FILES_DOWNLOAD_MAX_SIZE. Uses client session of application
+        by key client_session when it is set.
+        """
+        if session is None:
+            session = cls.app.get('client_session')
+        if session is None:
+            async with client.ClientSession(loop=cls.app.loop) as session:
+                return await cls.from_url(
+                    url, user=user, connection=connection, session=session)
+
+        max_size = getattr(settings, 'FILES_DOWNLOAD_MAX_SIZE', 2 ** 23)
+        chunk_size = getattr(settings, 'FILES_DOWNLOAD_CHUNK_SIZE', 2 ** 16)
+        with tempfile.TemporaryFile() as content:
             async with session.get(url) as response:
                 if response.status != 200:
                     return
                 l = response.content_length
-                if not l or l > 2 ** 23:
+                if l and l > max_size:
                     return
-                content_type = response.content_type
-                if not content_type.startswith('image'):
-                    return
-                content = BytesIO(await response.read())
+                head = b''
+                content_type = None
+                size = 0
+                hasher = hashlib.sha256() if dedup_enabled() else None
+                while True:
+                    chunk = await response.content.read(chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_size:
+                        return
+                    if content_type is None:
+                        head += chunk[:SNIFF_SIZE]
+                        if len(head) >= SNIFF_SIZE:
+                            content_type = sniff_image_type(head)
+                            if not content_type:
+                                return
+                    if hasher is not None:
+                        hasher.update(chunk)
+                    # Local temporary file, write is not worth a thread
+                    content.write(chunk)
                 filename = response.url.name
-        exts = mimetypes.guess_all_extensions(content_type)
-        for ext in exts:
-            if filename.endswith(ext):
-                break
-        else:
-            if exts:
-                filename += exts[-1]
-        name = await cls.app.loop.run_in_executor(
-            None, image_storage.save, filename, content)
+            if content_type is None:
+                content_type = sniff_image_type(head)
+                if not content_type:
+                    return
+            exts = mimetypes.guess_all_extensions(content_type)
+            for ext in exts:
+                if filename.endswith(ext):
+                    break
+            else:
+                if exts:
+                    filename += exts[-1]
+            content.seek(0)
+            name, meta = await cls.save_file(
+                filename, content,
+                sha256=hasher and hasher.hexdigest(),
+                connection=connection)
         image_uuid = image_storage.uuid(name)
-        return await cls.create(
+        obj = await cls.create(
             uuid=image_uuid,
             image=name,
             mime_type=content_type,
+            meta=meta,
             created_at=utils.now(),
             author_id=user.pk,
             connection=connection
         )
+        obj.schedule_renditions()
+        return obj
 
     @classmethod
     async def from_field(cls, file_field, *, user, connection=None):
@@ -71,21 +125,101 @@ class Image(Model):
         else:
             if exts:
                 name += exts[-1]
-        name = await cls.app.loop.run_in_executor(
-            None, image_storage.save, name, file_field.file)
+        name, meta = await cls.save_file(
+            name, file_field.file, connection=connection)
         image_uuid = image_storage.uuid(name)
-        return await cls.create(
+        obj = await cls.create(
             uuid=image_uuid,
             image=name,
             mime_type=file_field.content_type,
+            meta=meta,
             created_at=utils.now(),
             author_id=user.pk,
             connection=connection
         )
+        obj.schedule_renditions()
+        return obj
+
+    @classmethod
+    async def save_file(cls, filename, content, sha256=None, connection=None):
+        """
+        Saves content to image storage, returns name and meta of image.
+        Meta has dimensions, format, EXIF orientation and placeholder
+        extracted in the resizer pool.
+
+        With FILES_DEDUP content is hashed while it is saved.
+        When an image with the same sha256 exists, its file and renditions
+        are hard linked instead of being stored and resized again.
+        Pass sha256 when it is already known to skip writing duplicates.
+        """
+        storage = get_storage()
+        name = None
+        meta = {}
+        if dedup_enabled():
+            if sha256 is None:
+                name, sha256 = await storage.save_hashed(filename, content)
+            meta['sha256'] = sha256
+            original = await cls.get_one(
+                cls.table.c.meta['sha256'].astext == sha256,
+                connection=connection, silent=True)
+            if original is not None:
+                linked_name = name or await storage.get_available_name(filename)
+                original_meta = original.meta or {}
+                try:
+                    await storage.link(original.image, linked_name)
+                    linked = await image.link_renditions(
+                        original.image, linked_name,
+                        original_meta.get('renditions', ()))
+                except OSError:
+                    logger.exception('Image %s is not linked', original.image)
+                else:
+                    for key, cachename in linked:
+                        image.get_rendition_index().add(cachename)
+                    meta['renditions'] = sorted(key for key, _ in linked)
+                    meta.update(
+                        (k, original_meta[k]) for k in image_processors.META_FIELDS
+                        if k in original_meta)
+                    return linked_name, meta
+        if name is None:
+            name = await storage.save(filename, content)
+        meta.update(await image.extract_meta(cls.app, name))
+        return name, meta
+
+    def schedule_renditions(self, sizes=None):
+        """
+        Starts background creation of renditions,
+        by default of sizes configured for image storage
+        in format of source and in negotiated formats
+        """
+        if sizes is None:
+            sizes = image_storage.renditions
+            sizes += [
+                (w, h, fmt) for w, h, *f in sizes if not f
+                for fmt in image.get_output_formats()]
+        existing = set((self.get('meta') or {}).get('renditions', ()))
+        sizes = [
+            i for i in sizes
+            if image_processors.rendition_key(*i) not in existing]
+        if sizes:
+            return image.schedule(self.app, self.create_renditions(sizes))
+
+    async def create_renditions(self, sizes, connection=None):
+        """Creates renditions and records their keys in meta"""
+        photo = image_processors.Image(self)
+        keys = await image.generate_renditions(self.app, photo, sizes)
+        if not keys:
+            return
+        renditions = sorted(photo.renditions.union(keys))
+        self.setdefault('meta', {})['renditions'] = renditions
+        await self.update_json('meta', renditions=renditions, connection=connection)
+        # Cached image is loaded without these renditions
+        image.get_cache().delete(str(self.pk))
 
     @classmethod
     async def delete_name(cls, name, connection=None):
-        await cls.app.loop.run_in_executor(
-            None, image_storage.delete, name)
+        # Deduplicated images are hard links,
+        # content is kept on disk while other images refer to it
+        await image.delete_image_files(name)
         uid = image_storage.uuid(name)
         await cls.delete_where(uid, connection=connection)
+        image.get_cache().delete(str(uid))
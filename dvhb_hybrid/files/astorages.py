@@ -0,0 +1,304 @@
+import asyncio
+import functools
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from urllib.parse import quote, urlencode
+from xml.etree import ElementTree
+
+import aiohttp
+import yarl
+from django.conf import settings
+
+from .storages import image_storage
+
+logger = logging.getLogger(__name__)
+
+# Kinds of storage, FILES_STORAGE
+STORAGE_LOCAL = 'local'
+STORAGE_OBJECT = 'object'
+
+storage = None
+
+
+class StorageError(OSError):
+    pass
+
+
+class AsyncStorage:
+    """
+    Async storage of files with names relative to its root.
+    Names of new files are made by Django storage of images.
+    """
+    # Files are on local disk and have path
+    local = False
+
+    def __init__(self, storage=image_storage, concurrency=16):
+        self.storage = storage
+        # Number of I/O operations at once
+        self.concurrency = concurrency
+        self._loop = None
+        self._semaphore = None
+
+    def get_semaphore(self):
+        loop = asyncio.get_event_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    def path(self, name):
+        raise NotImplementedError()
+
+    async def close(self):
+        pass
+
+    async def get_available_name(self, name):
+        raise NotImplementedError()
+
+    async def save(self, name, content):
+        """Saves content of file-like object, returns name of new file"""
+        raise NotImplementedError()
+
+    async def save_hashed(self, name, content):
+        """Saves content and returns its name and sha256 hex digest"""
+        raise NotImplementedError()
+
+    async def read(self, name):
+        """Returns content of file, raises FileNotFoundError"""
+        raise NotImplementedError()
+
+    async def write(self, name, data):
+        """Writes data to file with name, replaces existing file"""
+        raise NotImplementedError()
+
+    async def exists(self, name):
+        raise NotImplementedError()
+
+    async def delete(self, name):
+        raise NotImplementedError()
+
+    async def delete_dir(self, name):
+        """Deletes all files under directory name"""
+        raise NotImplementedError()
+
+    async def link(self, source, name):
+        """Makes file name with content of file source"""
+        raise NotImplementedError()
+
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _write_file(path, data):
+    dirname = os.path.dirname(path)
+    os.makedirs(dirname, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class LocalStorage(AsyncStorage):
+    """
+    Storage on local disk, files are sharded into directories
+    by first bytes of uuid. Blocking calls run in executor,
+    at most concurrency of them at once so bursts of uploads
+    do not take all threads of the default executor.
+    """
+    local = True
+
+    async def _run(self, func, *args):
+        async with self.get_semaphore():
+            return await asyncio.get_event_loop().run_in_executor(None, func, *args)
+
+    def path(self, name):
+        return self.storage.path(name)
+
+    async def get_available_name(self, name):
+        return await self._run(self.storage.get_available_name, name)
+
+    async def save(self, name, content):
+        return await self._run(self.storage.save, name, content)
+
+    async def save_hashed(self, name, content):
+        return await self._run(self.storage.save_hashed, name, content)
+
+    async def read(self, name):
+        return await self._run(_read_file, self.path(name))
+
+    async def write(self, name, data):
+        await self._run(_write_file, self.path(name), data)
+
+    async def exists(self, name):
+        return await self._run(os.path.exists, self.path(name))
+
+    async def delete(self, name):
+        await self._run(self.storage.delete, name)
+
+    async def delete_dir(self, name):
+        await self._run(functools.partial(
+            shutil.rmtree, self.path(name), ignore_errors=True))
+
+    async def link(self, source, name):
+        await self._run(self.storage.link, source, name)
+
+
+def _find_text(element, tag):
+    """Returns text of first child with tag ignoring XML namespace"""
+    for i in element:
+        if i.tag == tag or i.tag.endswith('}' + tag):
+            return i.text
+
+
+class ObjectStorage(AsyncStorage):
+    """
+    S3-compatible object storage using path-style URLs
+    endpoint/bucket/name. Requests are signed by auth callable
+    taking method, url with query string and headers with
+    x-amz-content-sha256 of payload and returning headers to send,
+    without auth bucket must accept anonymous requests.
+    Resizes of renditions read and write files through it.
+    """
+    def __init__(self, endpoint, bucket, session=None, auth=None,
+                 storage=image_storage, concurrency=16):
+        super().__init__(storage, concurrency)
+        self.endpoint = endpoint.rstrip('/')
+        self.bucket = bucket
+        self.auth = auth
+        self.session = session
+        self._own_session = None
+
+    def get_url(self, name=''):
+        return '{}/{}/{}'.format(self.endpoint, self.bucket, quote(name))
+
+    def get_session(self):
+        if self.session is not None:
+            return self.session
+        if self._own_session is None or self._own_session.closed:
+            self._own_session = aiohttp.ClientSession(
+                loop=asyncio.get_event_loop())
+        return self._own_session
+
+    async def close(self):
+        if self._own_session is not None:
+            await self._own_session.close()
+            self._own_session = None
+
+    async def request(self, method, name='', *, params=None, headers=None,
+                      data=None, allow_status=()):
+        """
+        Returns status and body of response,
+        raises StorageError on other than 2xx and allow_status
+        """
+        url = self.get_url(name)
+        if params:
+            # Signed as sent, query is not encoded again by client
+            url += '?' + urlencode(sorted(params.items()), quote_via=quote)
+        headers = dict(headers or {})
+        headers['x-amz-content-sha256'] = hashlib.sha256(data or b'').hexdigest()
+        if self.auth is not None:
+            headers = self.auth(method, url, headers)
+        async with self.get_semaphore():
+            try:
+                async with self.get_session().request(
+                        method, yarl.URL(url, encoded=True),
+                        headers=headers, data=data) as response:
+                    body = await response.read()
+            except aiohttp.ClientError as e:
+                raise StorageError('{} {} failed: {}'.format(method, name, e)) from e
+        status = response.status
+        if status >= 300 and status not in allow_status:
+            raise StorageError('{} {} failed: {} {}'.format(
+                method, name, status, body[:200]))
+        return status, body
+
+    async def get_available_name(self, name):
+        # Names have random uuid, no need to ask for existence
+        return self.storage.get_name(name)
+
+    async def save(self, name, content):
+        name = await self.get_available_name(name)
+        # Uploads are in local temporary files
+        content = getattr(content, 'file', content)
+        await self.write(name, content.read())
+        return name
+
+    async def save_hashed(self, name, content):
+        name = await self.get_available_name(name)
+        data = getattr(content, 'file', content).read()
+        await self.write(name, data)
+        return name, hashlib.sha256(data).hexdigest()
+
+    async def read(self, name):
+        status, body = await self.request('GET', name, allow_status=(404,))
+        if status == 404:
+            raise FileNotFoundError(name)
+        return body
+
+    async def write(self, name, data):
+        await self.request('PUT', name, data=data)
+
+    async def exists(self, name):
+        status, _ = await self.request('HEAD', name, allow_status=(404,))
+        return status != 404
+
+    async def delete(self, name):
+        await self.request('DELETE', name, allow_status=(404,))
+
+    async def list(self, prefix):
+        """Returns names of files starting with prefix"""
+        names = []
+        params = {'list-type': '2', 'prefix': prefix}
+        while True:
+            _, body = await self.request('GET', params=params)
+            root = ElementTree.fromstring(body)
+            for i in root:
+                if i.tag == 'Contents' or i.tag.endswith('}Contents'):
+                    names.append(_find_text(i, 'Key'))
+            token = _find_text(root, 'NextContinuationToken')
+            if _find_text(root, 'IsTruncated') != 'true' or not token:
+                return names
+            params['continuation-token'] = token
+
+    async def delete_dir(self, name):
+        names = await self.list(name.rstrip('/') + '/')
+        await asyncio.gather(*[self.delete(i) for i in names])
+
+    async def link(self, source, name):
+        # Server-side copy, content is not transferred
+        await self.request('PUT', name, headers={
+            'x-amz-copy-source': '/{}/{}'.format(self.bucket, quote(source)),
+        })
+
+
+def get_storage():
+    """
+    Returns storage of images configured by FILES_STORAGE.
+    Object storage takes parameters of ObjectStorage
+    from FILES_OBJECT_STORAGE
+    """
+    global storage
+    if storage is None:
+        concurrency = getattr(settings, 'FILES_STORAGE_CONCURRENCY', 16)
+        kind = getattr(settings, 'FILES_STORAGE', STORAGE_LOCAL)
+        if kind == STORAGE_OBJECT:
+            storage = ObjectStorage(
+                concurrency=concurrency, **settings.FILES_OBJECT_STORAGE)
+        else:
+            storage = LocalStorage(image_storage, concurrency=concurrency)
+    return storage
+
+
+async def close_storage(app):
+    """Closes client session of storage, add it to on_cleanup of application"""
+    if storage is not None:
+        await storage.close()
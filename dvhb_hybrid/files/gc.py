@@ -0,0 +1,153 @@
+import asyncio
+import collections
+import datetime
+import functools
+import logging
+import os
+import shutil
+
+import sqlalchemy as sa
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .. import utils
+from . import image
+
+logger = logging.getLogger(__name__)
+
+
+def get_references():
+    """
+    Returns queries of referenced images from FILES_GC_REFERENCES.
+    Queries take lists of image names and uuids as names and uuids
+    and return any columns with names or uuids of referenced images.
+    There is no default, images used by a model missing in the queries
+    would be deleted
+    """
+    references = getattr(settings, 'FILES_GC_REFERENCES', None)
+    if not references:
+        raise ImproperlyConfigured(
+            'FILES_GC_REFERENCES should list queries of referenced images')
+    return list(references)
+
+
+def list_rendition_dirs(top):
+    """Returns directories of renditions named by uuid of image"""
+    result = []
+    for dirpath, dirnames, filenames in os.walk(top):
+        for d in list(dirnames):
+            uid = utils.get_uuid4(d)
+            if uid is not None:
+                result.append((uid, os.path.join(dirpath, d)))
+                dirnames.remove(d)
+    return result
+
+
+class ImageCollector:
+    """
+    Deletes images not referenced by any of reference queries
+    together with their renditions.
+
+    Rows are streamed by server-side cursor in batches, every batch
+    of orphans is deleted in one DELETE and their files are deleted
+    by storage with bounded concurrency.
+    Orphans are only counted unless dry_run is off.
+    """
+    def __init__(self, app, references, *, batch_size=1000, concurrency=8,
+                 min_age=86400, dry_run=True):
+        self.app = app
+        self.references = references
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        # Fresh images may be not referenced yet
+        self.min_age = min_age
+        self.dry_run = dry_run
+        self.stats = collections.Counter()
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(self):
+        if not self.references:
+            raise ImproperlyConfigured('No queries of referenced images')
+        Image = self.app.models.image
+        created_before = utils.now() - datetime.timedelta(seconds=self.min_age)
+        batch = []
+        async with Image.get_list_cursor(
+                Image.table.c.created_at < created_before,
+                fields=['uuid', 'image'],
+                chunk_size=self.batch_size) as cursor:
+            async for obj in cursor:
+                batch.append(obj)
+                if len(batch) >= self.batch_size:
+                    await self.collect(batch)
+                    batch = []
+        if batch:
+            await self.collect(batch)
+        self._mark_deleted()
+        return self.stats
+
+    async def get_referenced(self, names, uuids):
+        referenced = set()
+        params = {'names': names, 'uuids': uuids}
+        async with self.app['db'].acquire() as conn:
+            for sql in self.references:
+                result = await conn.execute(sql, params)
+                for row in await result.fetchall():
+                    referenced.update(str(v) for v in row if v is not None)
+        return referenced
+
+    async def collect(self, batch):
+        names = [i.image for i in batch]
+        uuids = [str(i.uuid) for i in batch]
+        referenced = await self.get_referenced(names, uuids)
+        orphans = [
+            i for i in batch
+            if i.image not in referenced and str(i.uuid) not in referenced]
+        self.stats['scanned'] += len(batch)
+        self.stats['orphans'] += len(orphans)
+        if self.dry_run or not orphans:
+            return
+        Image = self.app.models.image
+        await Image.delete_where(Image.table.c.uuid.in_([i.uuid for i in orphans]))
+        self.stats['deleted'] += len(orphans)
+        await self._delete_files(image.delete_image_files, [i.image for i in orphans])
+
+    async def sweep_renditions(self):
+        """Deletes renditions of images which do not exist on local disk"""
+        loop = self.app.loop
+        top = os.path.join(
+            settings.MEDIA_ROOT, image.get_image_factory().cachefile_dir)
+        dirs = await loop.run_in_executor(None, list_rendition_dirs, top)
+        Image = self.app.models.image
+        t = Image.table
+        for i in range(0, len(dirs), self.batch_size):
+            batch = dirs[i:i + self.batch_size]
+            async with self.app['db'].acquire() as conn:
+                result = await conn.execute(
+                    sa.select([t.c.uuid])
+                    .where(t.c.uuid.in_([uid for uid, _ in batch])))
+                existing = {row.uuid for row in await result.fetchall()}
+            orphans = [path for uid, path in batch if uid not in existing]
+            self.stats['rendition_dirs'] += len(orphans)
+            if not self.dry_run:
+                await self._delete_files(
+                    functools.partial(loop.run_in_executor, None, shutil.rmtree),
+                    orphans)
+        self._mark_deleted()
+        return self.stats
+
+    async def _delete(self, func, arg):
+        async with self._semaphore:
+            await func(arg)
+
+    async def _delete_files(self, func, args):
+        results = await asyncio.gather(
+            *[self._delete(func, i) for i in args], return_exceptions=True)
+        for arg, result in zip(args, results):
+            if isinstance(result, Exception):
+                self.stats['errors'] += 1
+                logger.error('Deletion of %s failed', arg, exc_info=result)
+
+    def _mark_deleted(self):
+        if not self.dry_run and (self.stats['deleted'] or self.stats['rendition_dirs']):
+            # Servers forget renditions of deleted images
+            image.get_rendition_cache().mark_pruned()
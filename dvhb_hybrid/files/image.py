@@ -1,127 +1,598 @@
 import asyncio
+import functools
+import logging
 import os
-import weakref
-from concurrent.futures import ProcessPoolExecutor as PoolExecutor
+import time
 from uuid import UUID
 
 import psycopg2
 from aiohttp import web
 from django.conf import settings
+from PIL import Image as PILImage
 
 from .. import aviews
-from .utils import save_image
+from ..cache import BatchLoader, LRUCache, MISSING
+from ..metrics import registry
+from .astorages import get_storage
+from .index import FileIndex
+from .rendition_cache import RenditionCache
+from .resizer import Resizer, ResizerOverloaded, OVERLOAD_ORIGIN
+from .storages import image_storage
+from .utils import create_image
 from . import image_processors
 
-cache = weakref.WeakValueDictionary()
-resizer = PoolExecutor(max_workers=1)
-image_factory = image_processors.ImageFactory()
+logger = logging.getLogger(__name__)
+
+# How photo_handler serves files, FILES_SERVE_MODE
+SERVE_ACCEL = 'accel'  # X-Accel-Redirect to nginx
+SERVE_FILE = 'file'  # stream file by aiohttp
+# Names of images and renditions are derived from uuid and never reused
+CACHE_CONTROL_IMMUTABLE = 'public, max-age=31536000, immutable'
+# Original served instead of rendition must not stick in caches
+CACHE_CONTROL_FALLBACK = 'no-store'
+
+# Futures of lookups and resizes in progress
+in_flight = {}
+# Resolved images and (url, mime_type) of renditions
+cache = None
+# Batches lookups of images by uuid
+image_loader = None
+resizer = None
+image_factory = None
+# Names of renditions existing on disk
+rendition_index = None
+# Background jobs of eager renditions
+rendition_tasks = set()
+# Formats of renditions to negotiate
+output_formats = None
+# Disk budget of renditions, their access times not recorded yet
+rendition_cache = None
+rendition_access = {}
+maintenance = {
+    'started_at': time.time(),
+    'pruned_at': time.time(),
+    'future': None,
+}
+
+# Metrics of images, exposed by metrics.metrics_handler
+PHOTO_REQUEST = registry.counter('files_photo_request', 'Requests of photos')
+PHOTO_FROM_CACHE = registry.counter(
+    'files_photo_from_cache', 'Requests resolved by cache')
+PHOTO_CACHE_WAIT = registry.counter(
+    'files_photo_cache_wait', 'Requests waiting for resolution in progress')
+PHOTO_DB = registry.counter('files_photo_db', 'Lookups of images')
+PHOTO_DB_CACHE = registry.counter('files_photo_db_cache', 'Images found in cache')
+PHOTO_DB_CACHE_WAIT = registry.counter(
+    'files_photo_db_cache_wait', 'Lookups waiting for lookup in progress')
+PHOTO_DB_FETCH = registry.counter('files_photo_db_fetch', 'Images found in database')
+PHOTO_DB_ERROR = registry.counter('files_photo_db_error', 'Failed lookups')
+PHOTO_DB_QUERY = registry.counter('files_photo_db_query', 'Queries of images')
+PHOTO_DB_SAVED = registry.counter(
+    'files_photo_db_saved', 'Queries and connection checkouts saved by batching')
+PHOTO_DB_BATCH_MAX = registry.gauge(
+    'files_photo_db_batch_max', 'Max number of images in one query')
+PHOTO_DB_SECONDS = registry.histogram(
+    'files_photo_db_seconds', 'Time of queries of images')
+PHOTO_RENDITION = registry.counter(
+    'files_photo_rendition', 'Renditions known from meta of image')
+PHOTO_RESIZE = registry.counter('files_photo_resize', 'Renditions resized on request')
+PHOTO_RESIZE_ERROR = registry.counter(
+    'files_photo_resize_error', 'Renditions failed to resize')
+PHOTO_RESIZE_EAGER = registry.counter(
+    'files_photo_resize_eager', 'Renditions resized on upload')
+RESIZER_OVERLOAD = registry.counter(
+    'files_resizer_overload', 'Resizes rejected by full queue')
+RENDITION_PRUNED = registry.counter(
+    'files_rendition_pruned', 'Renditions forgotten after pruning')
+# Collected from cache, index and resizer on exposition
+CACHE_HIT = registry.counter('files_cache_hit', 'Hits of cache of images')
+CACHE_MISS = registry.counter('files_cache_miss', 'Misses of cache of images')
+CACHE_EVICTION = registry.counter(
+    'files_cache_eviction', 'Evictions from cache of images')
+CACHE_SIZE = registry.gauge('files_cache_size', 'Entries in cache of images')
+INDEX_SIZE = registry.gauge('files_index_size', 'Renditions in index')
+INDEX_HIT = registry.counter('files_index_hit', 'Renditions found in index')
+INDEX_STAT = registry.counter('files_index_stat', 'Renditions checked in storage')
+RESIZER_PENDING = registry.gauge('files_resizer_pending', 'Resize tasks in pool')
+RESIZER_QUEUED = registry.gauge(
+    'files_resizer_queued', 'Resize tasks waiting for a worker')
+RESIZER_BROKEN = registry.counter('files_resizer_broken', 'Restarts of broken pool')
+
+
+def get_image_factory():
+    global image_factory
+    if image_factory is None:
+        image_factory = image_processors.ImageFactory(
+            engine=getattr(settings, 'FILES_RESIZE_ENGINE', image_processors.ENGINE_IMAGEKIT),
+            cachefile_dir=getattr(settings, 'IMAGEKIT_CACHEFILE_DIR', None),
+            quality=getattr(settings, 'FILES_RESIZE_QUALITY', None),
+        )
+    return image_factory
+
+
+def get_output_formats():
+    """
+    Returns formats of FILES_RESIZE_FORMATS in order of preference
+    which Pillow can save. Negotiation is off by default
+    """
+    global output_formats
+    if output_formats is None:
+        # Plugins register their formats on init, not on import
+        PILImage.init()
+        output_formats = [
+            i.upper() for i in getattr(settings, 'FILES_RESIZE_FORMATS', [])
+            if i.upper() in PILImage.SAVE and i.upper() in PILImage.MIME
+        ]
+    return output_formats
+
+
+def parse_accept(value):
+    """
+    Returns dict of media types with their quality values
+
+    >>> sorted(parse_accept('image/webp,image/*;q=0.8, */*;q=0').items())
+    [('*/*', 0.0), ('image/*', 0.8), ('image/webp', 1.0)]
+    """
+    result = {}
+    for item in value.split(','):
+        media_type, *params = item.split(';')
+        media_type = media_type.strip().lower()
+        if not media_type:
+            continue
+        q = 1.0
+        for param in params:
+            k, _, v = param.partition('=')
+            if k.strip() == 'q':
+                try:
+                    q = float(v)
+                except ValueError:
+                    q = 0.0
+        result[media_type] = q
+    return result
+
+
+def negotiate_format(request):
+    """
+    Returns format of renditions explicitly accepted by client
+    or None to keep format of source image
+    """
+    accept = request.headers.get('Accept')
+    if not accept:
+        return
+    accepted = parse_accept(accept)
+    for fmt in get_output_formats():
+        if accepted.get(PILImage.MIME[fmt], 0) > 0:
+            return fmt
+
+
+def get_rendition_index():
+    global rendition_index
+    if rendition_index is None:
+        storage = get_storage()
+        rendition_index = FileIndex(
+            settings.MEDIA_ROOT, get_image_factory().cachefile_dir,
+            check=None if storage.local else storage.exists)
+    return rendition_index
+
+
+def get_rendition_cache():
+    global rendition_cache
+    if rendition_cache is None:
+        rendition_cache = RenditionCache.from_settings(
+            get_image_factory().cachefile_dir,
+            # Eager renditions are recorded in Image.meta, keep them
+            keep={
+                image_processors.rendition_key(w, h)
+                for w, h, *_ in image_storage.renditions},
+        )
+    return rendition_cache
+
+
+def record_access(app, name):
+    """
+    Remembers access to rendition for eviction by disk budget.
+    Accesses are written to index and budget is checked in executor
+    every FILES_RENDITION_FLUSH_INTERVAL seconds.
+    Budget is kept only for local storage, without budget only marker
+    of pruning by other processes or by gc command is checked
+    """
+    if not get_storage().local:
+        return
+    now = time.time()
+    if get_rendition_cache().budget is not None:
+        rendition_access[name] = now
+    interval = getattr(settings, 'FILES_RENDITION_FLUSH_INTERVAL', 60)
+    if maintenance['future'] is not None or now - maintenance['started_at'] < interval:
+        return
+    accessed = rendition_access.copy()
+    rendition_access.clear()
+    maintenance['started_at'] = now
+    f = maintenance['future'] = app.loop.run_in_executor(
+        None, get_rendition_cache().maintain, accessed)
+
+    def done(f):
+        maintenance['future'] = None
+        if f.cancelled():
+            return
+        elif f.exception():
+            logger.error('Rendition cache maintenance failed', exc_info=f.exception())
+            return
+        pruned_at = f.result()
+        if pruned_at and pruned_at > maintenance['pruned_at']:
+            # Some renditions are deleted, forget known ones
+            maintenance['pruned_at'] = pruned_at
+            get_rendition_index().clear()
+            get_cache().clear()
+            RENDITION_PRUNED.inc()
+    f.add_done_callback(done)
+
+
+async def load_rendition_index(app):
+    """
+    Fills index of renditions with files on disk,
+    add it to on_startup of application to avoid stats after restart
+    """
+    await get_rendition_index().load(app.loop)
+
+
+async def create_shards(app):
+    """
+    Creates shard directories of images in executor with FILES_PRECREATE_SHARDS,
+    add it to on_startup of application or run command create_shards
+    """
+    if image_storage.precreate_shards and get_storage().local:
+        await app.loop.run_in_executor(None, image_storage.create_shards)
+
+
+def get_cache():
+    global cache
+    if cache is None:
+        cache = LRUCache(
+            maxsize=getattr(settings, 'FILES_CACHE_SIZE', 10000),
+            ttl=getattr(settings, 'FILES_CACHE_TTL', 3600),
+        )
+    return cache
+
+
+def collect_metrics():
+    c = get_cache()
+    CACHE_HIT.set(c.hits)
+    CACHE_MISS.set(c.misses)
+    CACHE_EVICTION.set(c.evictions)
+    CACHE_SIZE.set(len(c))
+    index = get_rendition_index()
+    INDEX_SIZE.set(len(index))
+    INDEX_HIT.set(index.hits)
+    INDEX_STAT.set(index.stats)
+    r = get_resizer()
+    RESIZER_PENDING.set(r.pending)
+    RESIZER_QUEUED.set(r.queued)
+    RESIZER_BROKEN.set(r.broken_counter)
+
+
+registry.add_collector(collect_metrics)
+
+
+def single_flight(key, func, *args):
+    """
+    Returns future shared by concurrent calls with the same key
+    and flag whether it is just created.
+    func returns coroutine or future, it is called only
+    if there is no future for key in progress
+    """
+    f = in_flight.get(key)
+    if f is not None:
+        return f, False
+    f = in_flight[key] = asyncio.ensure_future(func(*args))
+
+    def done(f):
+        if in_flight.get(key) is f:
+            del in_flight[key]
+    f.add_done_callback(done)
+    return f, True
+
+
+def get_resizer():
+    global resizer
+    if resizer is None:
+        resizer = Resizer.from_settings()
+    return resizer
+
+
+async def resize_remote(app, name, cachename, w, h, fmt=None):
+    """Creates rendition reading and writing files through storage"""
+    storage = get_storage()
+    data = await storage.read(name)
+    data = await get_resizer().submit(
+        app.loop, get_image_factory().resize_data, data, w, h, 'size', fmt)
+    await storage.write(cachename, data)
+
+
+def submit_resize(app, name, cachename, w, h, fmt=None):
+    """
+    Starts creation of rendition cachename of image name in the resizer pool.
+    Returns future, raises ResizerOverloaded when queue is full
+    """
+    resizer = get_resizer()
+    if get_storage().local:
+        return resizer.submit(
+            app.loop, get_image_factory().resize_to_cache,
+            name, w, h, settings.MEDIA_ROOT, fmt)
+    elif resizer.full:
+        resizer.overload_counter += 1
+        raise ResizerOverloaded()
+    return asyncio.ensure_future(
+        resize_remote(app, name, cachename, w, h, fmt), loop=app.loop)
+
+
+async def generate_renditions(app, photo, sizes):
+    """
+    Creates renditions of photo in the resizer pool.
+
+    :param photo: image_processors.Image
+    :param sizes: list of (width, height) or (width, height, format)
+    :return: keys of created renditions
+    """
+    factory = get_image_factory()
+    keys, names, futures = [], [], []
+    for w, h, *fmt in sizes:
+        fmt = fmt[0] if fmt else None
+        cachename = factory.get_resized_name(photo, w, h, fmt)
+        try:
+            f, new = single_flight(
+                cachename, submit_resize,
+                app, photo.name, cachename, w, h, fmt,
+            )
+        except ResizerOverloaded:
+            # It will be created on first request
+            RESIZER_OVERLOAD.inc()
+            continue
+        if new:
+            PHOTO_RESIZE_EAGER.inc()
+        keys.append(image_processors.rendition_key(w, h, fmt))
+        names.append(cachename)
+        futures.append(asyncio.shield(f))
+    if not futures:
+        return []
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    created = []
+    for key, name, result in zip(keys, names, results):
+        if isinstance(result, Exception):
+            logger.error(
+                'Rendition %s of %s failed', key, photo.name, exc_info=result)
+        else:
+            get_rendition_index().add(name)
+            created.append(key)
+    return created
+
+
+def get_renditions_dir(name):
+    """Returns name of directory with renditions of image name"""
+    return os.path.join(
+        get_image_factory().cachefile_dir, os.path.splitext(name)[0])
+
+
+async def delete_image_files(name):
+    """Deletes image file and its renditions"""
+    storage = get_storage()
+    await storage.delete(name)
+    await storage.delete_dir(get_renditions_dir(name))
+
+
+async def extract_meta(app, name):
+    """
+    Extracts meta of image file in the resizer pool.
+    Returns empty dict when image can not be read or pool is overloaded
+    """
+    storage = get_storage()
+    factory = get_image_factory()
+    try:
+        if storage.local:
+            f = get_resizer().submit(
+                app.loop, factory.extract_meta, name, settings.MEDIA_ROOT)
+        else:
+            f = get_resizer().submit(
+                app.loop, factory.extract_meta_data, await storage.read(name))
+    except ResizerOverloaded:
+        RESIZER_OVERLOAD.inc()
+        return {}
+    except OSError:
+        logger.exception('Image %s is not read', name)
+        return {}
+    try:
+        return await f
+    except Exception:
+        logger.exception('Meta of %s is not extracted', name)
+        return {}
+
+
+async def link_renditions(source, name, keys):
+    """
+    Makes renditions of image name links to existing renditions
+    of image source with identical content.
+
+    :return: list of linked (key, cachefile name)
+    """
+    factory = get_image_factory()
+    original, photo = image_processors.Image(), image_processors.Image()
+    original.name, photo.name = source, name
+    linked = []
+    for key in keys:
+        w, h, fmt = image_processors.parse_rendition_key(key)
+        cachename = factory.get_resized_name(photo, w, h, fmt)
+        try:
+            await get_storage().link(
+                factory.get_resized_name(original, w, h, fmt), cachename)
+        except OSError as e:
+            logger.warning('Rendition %s of %s is not linked: %s', key, source, e)
+        else:
+            linked.append((key, cachename))
+    return linked
+
+
+def schedule(app, coro):
+    """Runs coroutine in background logging its errors"""
+    task = app.loop.create_task(coro)
+    rendition_tasks.add(task)
+
+    def done(task):
+        rendition_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error('Background job failed', exc_info=task.exception())
+    task.add_done_callback(done)
+    return task
 
 
 async def image_upload(request, file):
-    image_uuid = await save_image(
+    obj = await create_image(
         request.app, request.user, file.filename,
         file.file, file.content_type)
-    return {
-        'uuid': image_uuid,
+    result = {
+        'uuid': obj.uuid,
     }
+    for k in image_processors.META_FIELDS:
+        if k in obj.meta:
+            result[k] = obj.meta[k]
+    return result
 
 
-async def get_image(request, uid):
-    request.app['state']['files_photo_db'] += 1
-    Image = request.app.models.image
-    async with request.app['db'].acquire() as conn:
-        result = await conn.execute(
-            Image.table.select()
-            .where(Image.table.c.uuid == uid)
-            .limit(1)
+async def load_images(app, uids):
+    """Returns dict of images by uuid fetched in one query"""
+    Image = app.models.image
+    with PHOTO_DB_SECONDS.time():
+        async with app['db'].acquire() as conn:
+            result = await conn.execute(
+                Image.table.select()
+                .where(Image.table.c.uuid.in_(uids))
+            )
+            rows = await result.fetchall()
+    PHOTO_DB_QUERY.inc()
+    PHOTO_DB_SAVED.inc(len(uids) - 1)
+    PHOTO_DB_BATCH_MAX.set(max(PHOTO_DB_BATCH_MAX.value, len(uids)))
+    # Keys match canonical form of get_image for both UUID and str columns
+    return {
+        str(UUID(str(row['uuid']))): image_processors.Image(row)
+        for row in rows}
+
+
+def get_image_loader(app):
+    global image_loader
+    if image_loader is None or image_loader.loop is not app.loop:
+        image_loader = BatchLoader(
+            functools.partial(load_images, app),
+            delay=getattr(settings, 'FILES_DB_BATCH_DELAY', 0.002),
+            max_size=getattr(settings, 'FILES_DB_BATCH_SIZE', 100),
+            loop=app.loop,
         )
-        photo = await result.fetchone()
+    return image_loader
+
+
+async def get_image(request, uid):
+    PHOTO_DB.inc()
+    photo = await get_image_loader(request.app).get(str(UUID(str(uid))))
 
     if photo:
-        request.app['state']['files_photo_db_fetch'] += 1
-        return image_processors.Image(photo)
+        PHOTO_DB_FETCH.inc()
+        get_cache().set(uid, photo)
+    else:
+        get_cache().set(uid, None, ttl=getattr(settings, 'FILES_CACHE_NEGATIVE_TTL', 60))
+    return photo
 
 
 def db_error(request, error):
-    request.app['state']['files_photo_db_error'] += 1
+    PHOTO_DB_ERROR.inc()
     request.app.logger.exception(error, exc_info=error)
 
 
-async def get_resized_image(request, uid, w, h):
+async def get_resized_image(request, uid, w, h, fmt=None):
     """
 
     :param request:
     :param uid:
     :param w:
     :param h:
+    :param fmt: format of rendition, format of source by default
     :return: (url, mimetype)
     """
-    f = cache.get(uid)
-    if not f:
-        f = cache[uid] = asyncio.ensure_future(get_image(request, uid))
-    if not f.done():
-        request.app['state']['files_photo_db_cache_wait'] += 1
+    photo = get_cache().get(uid)
+    if photo is MISSING:
+        f, new = single_flight(uid, get_image, request, uid)
+        if not new:
+            PHOTO_DB_CACHE_WAIT.inc()
         try:
-            photo = await f
+            photo = await asyncio.shield(f)
         except psycopg2.DatabaseError as e:
             return db_error(request, e)
-    elif f.cancelled():
-        del cache[uid]
-        request.app['state']['files_photo_db_cancel'] += 1
-        request.app.logger.error('Cancel %s', uid)
-        return
-    elif f.exception():
-        return db_error(request, f.exception())
     else:
-        request.app['state']['files_photo_db_cache'] += 1
-        photo = f.result()
+        PHOTO_DB_CACHE.inc()
     if not photo:
         return
 
     if w and h:
-        ci = image_factory.get_generator(w, h)(source=photo)
-        cachename = ci.cachefile_name
-        k = cachename
-        f = cache.get(k)
-        if not f:
-            exists = await request.app.loop.run_in_executor(
-                None, os.path.exists,
-                os.path.join(settings.MEDIA_ROOT, cachename)
-            )
-            f = cache.get(k)
+        factory = get_image_factory()
+        cachename = factory.get_resized_name(photo, w, h, fmt)
+        f = in_flight.get(cachename)
+        if image_processors.rendition_key(w, h, fmt) in photo.renditions:
+            PHOTO_RENDITION.inc()
+        elif not f:
+            exists = await get_rendition_index().exists(
+                request.app.loop, cachename)
+            f = in_flight.get(cachename)
             if not exists and not f:
-                global resizer
-                if getattr(resizer, '_broken', False):
-                    request.app['state']['files_resizer_broken'] += 1
-                    resizer = PoolExecutor(max_workers=1)
-                request.app['state']['files_photo_resize'] += 1
-                f = cache[k] = request.app.loop.run_in_executor(
-                    resizer, image_factory.resize, photo.name, w, h,
-                )
-        if not f:
-            pass
-        elif not f.done():
-            await f
-        elif f.cancelled():
-            del cache[k]
-            request.app['state']['files_photo_resize_cancel'] += 1
-            request.app.logger.error('Cancel %s', k)
-            return
-        elif f.exception():
-            request.app['state']['files_photo_resize_error'] += 1
-            request.app.logger.exception(
-                'Get resize error', exc_info=f.exception())
-            return
+                try:
+                    f, _ = single_flight(
+                        cachename, submit_resize,
+                        request.app, photo.name, cachename, w, h, fmt,
+                    )
+                except ResizerOverloaded as e:
+                    RESIZER_OVERLOAD.inc()
+                    e.photo = photo
+                    raise
+                PHOTO_RESIZE.inc()
+        if f:
+            try:
+                await asyncio.shield(f)
+            except ResizerOverloaded as e:
+                # Remote resize is overloaded after the source is read
+                RESIZER_OVERLOAD.inc()
+                e.photo = photo
+                raise
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                PHOTO_RESIZE_ERROR.inc()
+                request.app.logger.exception('Get resize error', exc_info=e)
+                # Broken source is not resized again on every request
+                get_cache().set(
+                    (uid, w, h, fmt), None,
+                    ttl=getattr(settings, 'FILES_CACHE_NEGATIVE_TTL', 60))
+                return
+            get_rendition_index().add(cachename)
         name = cachename
+        mime_type = PILImage.MIME[fmt] if fmt else photo.mime_type
     else:
         name = photo.name
+        mime_type = photo.mime_type
 
     url = settings.MEDIA_URL + name
-    return url, photo.mime_type
+    return url, mime_type
+
+
+async def resolve_image(request, uid, w, h, fmt=None):
+    result = await get_resized_image(request, uid, w, h, fmt)
+    if result:
+        get_cache().set((uid, w, h, fmt), result)
+    return result
+
+
+def forget_file(key, name):
+    """Drops cached result of file deleted behind our back, it is resolved again"""
+    get_cache().delete(key)
+    get_rendition_index().discard(name)
 
 
 async def photo_handler(request, uuid, width, height, retina):
-    request.app['state']['files_photo_request'] += 1
+    PHOTO_REQUEST.inc()
     try:
         UUID(uuid)
     except ValueError:
@@ -131,28 +602,53 @@ async def photo_handler(request, uuid, width, height, retina):
     if retina:
         width, height = 2 * width, 2 * height
 
-    key = (uuid, width, height)
-    f = cache.get(key)
-    if not f:
-        f = cache[key] = asyncio.ensure_future(
-            get_resized_image(request, uuid, width, height))
-    if not f.done():
-        request.app['state']['files_photo_cache_wait'] += 1
-        result = await f
-    elif f.cancelled():
-        del cache[key]
-        request.app['state']['files_photo_cache_cancel'] += 1
-        request.app.logger.error('Cancel %s', uuid)
-        return
-    elif f.exception():
-        request.app.logger.exception(
-            'Get resized photo error', exc_info=f.exception())
-        return
+    fmt = negotiate_format(request) if width and height else None
+    key = (uuid, width, height, fmt)
+    fallback = False
+    result = get_cache().get(key)
+    if result is not MISSING:
+        PHOTO_FROM_CACHE.inc()
     else:
-        request.app['state']['files_photo_from_cache'] += 1
-        result = f.result()
+        f, new = single_flight(key, resolve_image, request, uuid, width, height, fmt)
+        if not new:
+            PHOTO_CACHE_WAIT.inc()
+        try:
+            result = await asyncio.shield(f)
+        except ResizerOverloaded as e:
+            if getattr(settings, 'FILES_RESIZE_OVERLOAD', None) == OVERLOAD_ORIGIN:
+                result = settings.MEDIA_URL + e.photo.name, e.photo.mime_type
+                fallback = True
+            else:
+                raise web.HTTPServiceUnavailable(headers={'Retry-After': '1'})
 
     if result:
         url, mimetype = result
-        return aviews.response_file(url, mimetype)
+        name = url[len(settings.MEDIA_URL):]
+        if width and height and not fallback:
+            # Original is served instead, it is never evicted
+            record_access(request.app, name)
+        headers = {}
+        if width and height and get_output_formats():
+            # Rendition depends on Accept, keep caches from mixing them
+            headers['Vary'] = 'Accept'
+        if fallback:
+            headers['Cache-Control'] = CACHE_CONTROL_FALLBACK
+        if getattr(settings, 'FILES_SERVE_MODE', SERVE_ACCEL) == SERVE_FILE:
+            headers.setdefault('Cache-Control', getattr(
+                settings, 'FILES_CACHE_CONTROL', CACHE_CONTROL_IMMUTABLE))
+            storage = get_storage()
+            if storage.local:
+                # File response opens file after handler returns
+                if not await storage.exists(name):
+                    forget_file(key, name)
+                    raise web.HTTPNotFound()
+                return aviews.file_response(
+                    storage.path(name), mimetype, headers=headers)
+            try:
+                body = await storage.read(name)
+            except FileNotFoundError:
+                forget_file(key, name)
+                raise web.HTTPNotFound()
+            return web.Response(body=body, content_type=mimetype, headers=headers)
+        return aviews.response_file(url, mimetype, headers=headers)
     raise web.HTTPNotFound()
@@ -1,43 +1,256 @@
+import base64
+import io
+import math
+import os
+import tempfile
+
 import django
 from django.apps import apps
 from imagekit import ImageSpec
 from imagekit.cachefiles import ImageCacheFile
 import pilkit.processors
+import pilkit.utils
+from PIL import Image as PILImage
+
+# Engines of ImageFactory
+ENGINE_IMAGEKIT = 'imagekit'
+ENGINE_PILLOW = 'pillow'
+
+# Fields of Image.meta extracted from file
+META_FIELDS = ('width', 'height', 'format', 'orientation', 'placeholder')
+EXIF_ORIENTATION = 0x0112
+# Orientations which swap width and height
+ORIENTATION_TRANSPOSED = (5, 6, 7, 8)
+PLACEHOLDER_SIZE = 16
+_T = pilkit.processors.Transpose
+ORIENTATION_STEPS = {
+    2: [_T.FLIP_HORIZONTAL],
+    3: [_T.ROTATE_180],
+    4: [_T.FLIP_VERTICAL],
+    5: [_T.ROTATE_270, _T.FLIP_HORIZONTAL],
+    6: [_T.ROTATE_270],
+    7: [_T.ROTATE_90, _T.FLIP_HORIZONTAL],
+    8: [_T.ROTATE_90],
+}
+
+
+def rendition_key(w, h, format=None):
+    key = '{}x{}'.format(w, h)
+    if format:
+        key += '.' + format.lower()
+    return key
+
+
+def parse_rendition_key(key):
+    """
+    Returns width, height and format of rendition key
+
+    >>> parse_rendition_key('150x150.webp')
+    (150, 150, 'WEBP')
+    """
+    size, _, format = key.partition('.')
+    w, h = size.split('x')
+    return int(w), int(h), format.upper() or None
+
+
+def get_orientation(img):
+    """Returns EXIF orientation of PIL image, 1 is normal"""
+    try:
+        return int(img.getexif().get(EXIF_ORIENTATION, 1))
+    except Exception:
+        return 1
+
+
+def transpose(img, orientation):
+    """Rotates PIL image to normal EXIF orientation"""
+    steps = ORIENTATION_STEPS.get(orientation)
+    if steps:
+        img = pilkit.processors.Transpose(*steps).process(img)
+    return img
+
+
+def get_placeholder(img, size=PLACEHOLDER_SIZE):
+    """Returns tiny JPEG of PIL image as data URI"""
+    img = img.convert('RGB')
+    img.thumbnail((size, size))
+    buf = io.BytesIO()
+    img.save(buf, 'JPEG', quality=50)
+    return 'data:image/jpeg;base64,' + base64.b64encode(buf.getvalue()).decode()
 
 
 class Image:
     def __init__(self, resultrowproxy=None):
+        # Keys of renditions known to exist
+        self.renditions = set()
         if resultrowproxy:
             self.name = resultrowproxy['image']
             self.mime_type = resultrowproxy['mime_type']
+            meta = resultrowproxy['meta'] or {}
+            self.renditions.update(meta.get('renditions', ()))
 
 
 class ImageFactory(object):
     processors = {
         'size': pilkit.processors.SmartResize,
     }
+    # Applied before processor to rotate image by EXIF orientation
+    transpose = pilkit.processors.Transpose(pilkit.processors.Transpose.AUTO)
+    quality = 70
+    cachefile_dir = 'CACHE/images'
+
+    def __init__(self, engine=ENGINE_IMAGEKIT, cachefile_dir=None, quality=None):
+        self.engine = engine
+        if cachefile_dir:
+            self.cachefile_dir = cachefile_dir
+        # Quality by format name, like {'JPEG': 70, 'WEBP': 75}
+        self.qualities = {k.upper(): v for k, v in (quality or {}).items()}
 
-    def get_generator(self, w, h, processor='size'):
+    def get_quality(self, name, format=None):
+        """Returns quality of output format or format of file name"""
+        if not format:
+            try:
+                format = pilkit.utils.extension_to_format(os.path.splitext(name)[1])
+            except pilkit.utils.UnknownExtension:
+                return self.quality
+        return self.qualities.get(format.upper(), self.quality)
+
+    def get_generator(self, w, h, processor='size', format=None, quality=None):
         processor = self.processors.get(processor)
+        if quality is None:
+            quality = self.quality
 
         class Generator(ImageSpec):
-            processors = [processor(w, h, upscale=True)]
-            # format = 'JPEG'
-            options = {'quality': 70}
+            processors = [self.transpose, processor(w, h, upscale=True)]
+            options = {'quality': quality}
 
             def get_hash(self):
                 return '{}x{}'.format(w, h)
 
+        Generator.format = format
         return Generator
 
-    def get_image(self, image, w, h):
-        generator = self.get_generator(w, h)(source=image)
+    def get_image(self, image, w, h, format=None):
+        generator = self.get_generator(
+            w, h, format=format,
+            quality=self.get_quality(image.name, format),
+        )(source=image)
         file = ImageCacheFile(generator)
         file.generate()
         return file
 
-    def resize(self, image_name, w, h):
+    def resize(self, image_name, w, h, format=None):
         django.setup()
         Image = apps.get_model('files.Image')
         image = Image(image=image_name)
-        self.get_image(image.image, w, h)
+        self.get_image(image.image, w, h, format=format)
+
+    def get_resized_name(self, source, w, h, format=None):
+        """Returns name of resized image for source with name attribute"""
+        if self.engine == ENGINE_PILLOW:
+            return self.get_cachefile_name(source.name, w, h, format=format)
+        return self.get_generator(w, h, format=format)(source=source).cachefile_name
+
+    def resize_to_cache(self, name, w, h, root, format=None):
+        """
+        Creates resized image for image with name relative to root.
+        Runs in worker process
+        """
+        if self.engine == ENGINE_PILLOW:
+            self.resize_file(
+                os.path.join(root, name),
+                os.path.join(root, self.get_cachefile_name(name, w, h, format=format)),
+                w, h, format=format)
+        else:
+            self.resize(name, w, h, format=format)
+
+    def get_cachefile_name(self, name, w, h, format=None):
+        """
+        Returns name of resized image like default imagekit namer
+        (source_name_as_path) does for generator of get_generator
+        """
+        root, ext = os.path.splitext(name)
+        if format:
+            ext = pilkit.utils.suggest_extension(name, format)
+        return os.path.normpath(os.path.join(
+            self.cachefile_dir, root, '{}x{}{}'.format(w, h, ext)))
+
+    def extract_meta(self, name, root):
+        """
+        Returns meta of image with name relative to root: size as displayed
+        after rotation by EXIF orientation, format, orientation and placeholder.
+        Runs in worker process
+        """
+        return self.get_meta(os.path.join(root, name))
+
+    def extract_meta_data(self, data):
+        """Returns meta of image content like extract_meta"""
+        return self.get_meta(io.BytesIO(data))
+
+    def get_meta(self, source):
+        with PILImage.open(source) as img:
+            orientation = get_orientation(img)
+            w, h = img.size
+            if orientation in ORIENTATION_TRANSPOSED:
+                w, h = h, w
+            meta = {
+                'width': w,
+                'height': h,
+                'format': img.format,
+                'orientation': orientation,
+            }
+            img.draft(img.mode, (PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+            meta['placeholder'] = get_placeholder(transpose(img, orientation))
+        return meta
+
+    def resize_image(self, source, w, h, processor='size', format=None):
+        """
+        Returns PIL image resized from source path or file and its format.
+        JPEG is decoded at reduced scale when possible.
+        Format is format or format of source.
+        """
+        processor = self.processors.get(processor)
+        with PILImage.open(source) as img:
+            fmt = format or img.format
+            orientation = get_orientation(img)
+            iw, ih = img.size
+            # Size before rotation by EXIF orientation
+            sw, sh = (h, w) if orientation in ORIENTATION_TRANSPOSED else (w, h)
+            ratio = max(sw / iw, sh / ih)
+            cover = max(math.ceil(iw * ratio), 1), max(math.ceil(ih * ratio), 1)
+            # JPEG decoder downscales by 1/2, 1/4 or 1/8 keeping size >= cover
+            img.draft(img.mode, cover)
+            img.load()
+            # Reduce by integer factor keeping twice of cover size for quality
+            factor = min(img.size[0] // (2 * cover[0]), img.size[1] // (2 * cover[1]))
+            if factor > 1 and hasattr(img, 'reduce'):
+                img = img.reduce(factor)
+            img = transpose(img, orientation)
+            img = processor(w, h, upscale=True).process(img)
+        return img, fmt
+
+    def resize_file(self, source, destination, w, h, processor='size', format=None):
+        """
+        Resizes image from source path to destination path by Pillow
+        without Django
+        """
+        img, fmt = self.resize_image(source, w, h, processor, format)
+        dirname = os.path.dirname(destination)
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pilkit.utils.save_image(img, f, fmt, {'quality': self.get_quality(source, fmt)})
+            os.replace(tmp, destination)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def resize_data(self, data, w, h, processor='size', format=None):
+        """
+        Returns content of image resized from content data by Pillow,
+        used with storages without local files. Runs in worker process
+        """
+        img, fmt = self.resize_image(io.BytesIO(data), w, h, processor, format)
+        buf = io.BytesIO()
+        pilkit.utils.save_image(img, buf, fmt, {'quality': self.get_quality('', fmt)})
+        return buf.getvalue()
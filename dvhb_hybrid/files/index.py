@@ -0,0 +1,80 @@
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class FileIndex:
+    """
+    In-process set of files known to exist under root/prefix.
+
+    Positive answers are given without I/O, a name which is not
+    in the index is checked on disk and added when found.
+    Names are stored without prefix to save memory.
+    Files of remote storage are checked by coroutine function
+    check taking name, they are not loaded.
+    """
+    def __init__(self, root, prefix, check=None):
+        self.root = root
+        self.prefix = os.path.normpath(prefix) + os.path.sep
+        self.check = check
+        self.hits = 0
+        self.stats = 0
+        self._names = set()
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return self._key(name) in self._names
+
+    def _key(self, name):
+        if name.startswith(self.prefix):
+            return name[len(self.prefix):]
+        return name
+
+    def add(self, name):
+        self._names.add(self._key(name))
+
+    def discard(self, name):
+        self._names.discard(self._key(name))
+
+    def clear(self):
+        self._names.clear()
+
+    def scan(self):
+        """Returns names of files under prefix, blocks on I/O"""
+        top = os.path.join(self.root, self.prefix)
+        names = set()
+        for dirpath, dirnames, filenames in os.walk(top):
+            rel = os.path.relpath(dirpath, top)
+            for f in filenames:
+                if not f.endswith('.tmp') and not f.startswith('.'):
+                    names.add(os.path.normpath(os.path.join(rel, f)))
+        return names
+
+    async def load(self, loop):
+        """Fills index with files on disk"""
+        if self.check is not None:
+            return
+        t = time.monotonic()
+        names = await loop.run_in_executor(None, self.scan)
+        self._names.update(names)
+        logger.info(
+            'Loaded %s files of %s in %.3f s',
+            len(names), self.prefix, time.monotonic() - t)
+
+    async def exists(self, loop, name):
+        if name in self:
+            self.hits += 1
+            return True
+        self.stats += 1
+        if self.check is not None:
+            found = await self.check(name)
+        else:
+            found = await loop.run_in_executor(
+                None, os.path.exists, os.path.join(self.root, name))
+        if found:
+            self.add(name)
+        return found
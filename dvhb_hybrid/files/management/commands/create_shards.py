@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from ...storages import image_storage
+
+
+class Command(BaseCommand):
+    help = 'Creates all shard directories of images for FILES_PRECREATE_SHARDS'
+
+    def handle(self, *args, **options):
+        if image_storage.create_shards():
+            self.stdout.write('Created {} directories'.format(
+                len(image_storage.get_shards())))
+        else:
+            self.stdout.write('Directories are created already')
@@ -0,0 +1,78 @@
+import asyncio
+
+import aiopg.sa
+from aiohttp import web
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError
+
+import dvhb_hybrid
+from dvhb_hybrid.amodels import AppModels
+from dvhb_hybrid.management import AsyncCommand
+
+from ...gc import ImageCollector, get_references
+
+
+class Command(AsyncCommand):
+    help = 'Finds images not referenced by FILES_GC_REFERENCES queries, deletes them and their renditions with --delete'
+    class_application = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--concurrency', type=int, default=8,
+            help='Number of files deleted at once')
+        parser.add_argument(
+            '--min-age', type=int, default=86400,
+            help='Keep images created less than seconds ago')
+        parser.add_argument(
+            '--renditions', action='store_true',
+            help='Also delete renditions of images missing in database')
+        parser.add_argument(
+            '--references', action='append',
+            help='Query of referenced images, FILES_GC_REFERENCES by default')
+        parser.add_argument(
+            '--delete', action='store_true',
+            help='Delete orphans, they are only counted by default')
+
+    async def create_app(self, loop):
+        """Creates application with database of Django and models"""
+        db = settings.DATABASES['default']
+        app = web.Application(loop=loop)
+        app['db'] = await aiopg.sa.create_engine(
+            database=db['NAME'],
+            user=db.get('USER') or None,
+            password=db.get('PASSWORD') or None,
+            host=db.get('HOST') or None,
+            port=db.get('PORT') or None,
+            loop=loop)
+        AppModels.import_all_models_from_packages(dvhb_hybrid)
+        app.models = app.m = AppModels(app)
+        return app
+
+    async def run(self, *args, **options):
+        references = options['references']
+        if not references:
+            try:
+                references = get_references()
+            except ImproperlyConfigured as e:
+                raise CommandError(
+                    '{}, or pass them by --references'.format(e))
+        app = await self.create_app(asyncio.get_event_loop())
+        try:
+            collector = ImageCollector(
+                app, references,
+                batch_size=options['batch_size'],
+                concurrency=options['concurrency'],
+                min_age=options['min_age'],
+                dry_run=not options['delete'])
+            stats = await collector.run()
+            if options['renditions']:
+                stats = await collector.sweep_renditions()
+        finally:
+            app['db'].close()
+            await app['db'].wait_closed()
+        if not options['delete']:
+            self.stdout.write('Dry run, pass --delete to delete orphans')
+        for k in ('scanned', 'orphans', 'deleted', 'rendition_dirs', 'errors'):
+            self.stdout.write('{}: {}'.format(k, stats[k]))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from ... import image
+
+
+class Command(BaseCommand):
+    help = 'Reports and prunes cache of image renditions by disk budget'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sync', action='store_true',
+            help='Index files on disk before report')
+        parser.add_argument(
+            '--prune', action='store_true',
+            help='Delete least recently used renditions over budget')
+        parser.add_argument(
+            '--budget', type=int,
+            help='Budget in bytes, FILES_RENDITION_BUDGET by default')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Show renditions to delete without deleting')
+
+    def handle(self, *args, **options):
+        cache = image.get_rendition_cache()
+        if options['sync']:
+            added, removed = cache.sync()
+            self.stdout.write('Indexed {} new files, removed {} records'.format(added, removed))
+        if options['prune']:
+            deleted, freed = cache.prune(
+                budget=options['budget'], dry_run=options['dry_run'])
+            for name in deleted if options['dry_run'] else ():
+                self.stdout.write(name)
+            self.stdout.write('{} {} renditions, {} bytes'.format(
+                'Would delete' if options['dry_run'] else 'Deleted',
+                len(deleted), freed))
+        report = cache.report()
+        for k in ('count', 'size', 'budget', 'oldest_access'):
+            self.stdout.write('{}: {}'.format(k, report[k]))
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0004_auto_20171213_0805'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            "CREATE INDEX files_image_sha256 ON files_image ((meta->>'sha256'))",
+            "DROP INDEX files_image_sha256",
+        ),
+    ]
@@ -0,0 +1,206 @@
+import contextlib
+import logging
+import os
+import sqlite3
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = '.renditions.sqlite3'
+# Touched after pruning, processes drop their in-memory state of renditions
+PRUNED_MARKER = '.renditions.pruned'
+
+SQL_CREATE = (
+    'CREATE TABLE IF NOT EXISTS rendition ('
+    'name TEXT PRIMARY KEY, size INTEGER NOT NULL, accessed REAL NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS rendition_accessed ON rendition (accessed)',
+)
+
+
+class RenditionCache:
+    """
+    Disk budget of generated renditions.
+
+    Size and last access time of files under root/prefix are kept
+    in sqlite index. When total size exceeds budget least recently used
+    files are deleted until size drops to low_watermark of budget.
+    Methods block on I/O, call them in executor.
+    """
+    def __init__(self, root, prefix, budget=None, low_watermark=0.9,
+                 index_path=None, keep=()):
+        self.root = root
+        self.prefix = os.path.normpath(prefix)
+        self.budget = budget
+        self.low_watermark = low_watermark
+        self.dir = os.path.join(root, self.prefix)
+        self.index_path = index_path or os.path.join(self.dir, INDEX_NAME)
+        self.marker_path = os.path.join(os.path.dirname(self.index_path), PRUNED_MARKER)
+        # Sizes like '150x150' which are never evicted
+        self.keep = frozenset(keep)
+
+    @classmethod
+    def from_settings(cls, prefix, keep=()):
+        return cls(
+            settings.MEDIA_ROOT, prefix,
+            budget=getattr(settings, 'FILES_RENDITION_BUDGET', None),
+            low_watermark=getattr(settings, 'FILES_RENDITION_BUDGET_LOW', 0.9),
+            index_path=getattr(settings, 'FILES_RENDITION_INDEX', None),
+            keep=keep,
+        )
+
+    @contextlib.contextmanager
+    def connect(self):
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        conn = sqlite3.connect(self.index_path, timeout=30)
+        try:
+            for sql in SQL_CREATE:
+                conn.execute(sql)
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _stat(self, name):
+        try:
+            return os.stat(os.path.join(self.root, name))
+        except FileNotFoundError:
+            return None
+
+    def is_rendition(self, name):
+        """Whether name is under prefix, other files like originals are never indexed"""
+        name = os.path.normpath(name)
+        return not os.path.isabs(name) and name.startswith(self.prefix + os.sep)
+
+    def touch(self, accessed):
+        """
+        Records access time of renditions
+
+        :param accessed: dict name -> timestamp
+        """
+        if not accessed:
+            return
+        with self.connect() as conn:
+            for name, ts in accessed.items():
+                if not self.is_rendition(name):
+                    logger.warning('%s is not a rendition, access is not recorded', name)
+                    continue
+                cur = conn.execute(
+                    'UPDATE rendition SET accessed = ? WHERE name = ?', (ts, name))
+                if cur.rowcount:
+                    continue
+                st = self._stat(name)
+                if st is not None:
+                    conn.execute(
+                        'INSERT OR REPLACE INTO rendition VALUES (?, ?, ?)',
+                        (name, st.st_size, ts))
+
+    def sync(self):
+        """
+        Adds files on disk missing in index and removes
+        records of deleted files. Returns numbers of added and removed
+        """
+        on_disk = {}
+        for dirpath, dirnames, filenames in os.walk(self.dir):
+            for f in filenames:
+                if f.startswith('.renditions') or f.endswith('.tmp'):
+                    continue
+                path = os.path.join(dirpath, f)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                name = os.path.relpath(path, self.root)
+                on_disk[name] = st.st_size, max(st.st_atime, st.st_mtime)
+        with self.connect() as conn:
+            indexed = {i for i, in conn.execute('SELECT name FROM rendition')}
+            added = [
+                (name, size, ts) for name, (size, ts) in on_disk.items()
+                if name not in indexed]
+            conn.executemany('INSERT INTO rendition VALUES (?, ?, ?)', added)
+            removed = [(i,) for i in indexed if i not in on_disk]
+            conn.executemany('DELETE FROM rendition WHERE name = ?', removed)
+        return len(added), len(removed)
+
+    def report(self):
+        with self.connect() as conn:
+            count, size, oldest = conn.execute(
+                'SELECT count(*), coalesce(sum(size), 0), min(accessed) '
+                'FROM rendition').fetchone()
+        return {
+            'count': count,
+            'size': size,
+            'budget': self.budget,
+            'oldest_access': oldest,
+        }
+
+    def _is_kept(self, name):
+        return os.path.basename(name).split('.')[0] in self.keep
+
+    def prune(self, budget=None, dry_run=False):
+        """
+        Deletes least recently used renditions
+        when their size exceeds budget.
+        Returns list of deleted names and their total size
+        """
+        budget = self.budget if budget is None else budget
+        if budget is None:
+            return [], 0
+        with self.connect() as conn:
+            total, = conn.execute(
+                'SELECT coalesce(sum(size), 0) FROM rendition').fetchone()
+            if total <= budget:
+                return [], 0
+            target = total - budget * self.low_watermark
+            deleted, foreign, freed = [], [], 0
+            rows = conn.execute(
+                'SELECT name, size FROM rendition ORDER BY accessed').fetchall()
+            for name, size in rows:
+                if freed >= target:
+                    break
+                elif not self.is_rendition(name):
+                    foreign.append((name,))
+                    continue
+                elif self._is_kept(name):
+                    continue
+                if not dry_run:
+                    try:
+                        os.unlink(os.path.join(self.root, name))
+                    except FileNotFoundError:
+                        pass
+                deleted.append(name)
+                freed += size
+            if not dry_run and deleted:
+                conn.executemany(
+                    'DELETE FROM rendition WHERE name = ?',
+                    [(i,) for i in deleted])
+            if not dry_run and foreign:
+                # Recorded by older versions, files are kept
+                conn.executemany('DELETE FROM rendition WHERE name = ?', foreign)
+        if not dry_run and deleted:
+            self.mark_pruned()
+            logger.info('Pruned %s renditions, %s bytes', len(deleted), freed)
+        return deleted, freed
+
+    def mark_pruned(self):
+        """Makes processes forget renditions they know"""
+        os.makedirs(os.path.dirname(self.marker_path), exist_ok=True)
+        with open(self.marker_path, 'a'):
+            os.utime(self.marker_path)
+
+    def pruned_at(self):
+        """Returns time of last pruning or None"""
+        try:
+            return os.stat(self.marker_path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def maintain(self, accessed):
+        """
+        Records accesses and prunes over budget.
+        Returns time of last pruning by any process
+        """
+        self.touch(accessed)
+        if self.budget is not None:
+            self.prune()
+        return self.pruned_at()
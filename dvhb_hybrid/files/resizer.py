@@ -0,0 +1,137 @@
+import asyncio
+import functools
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from ..metrics import registry
+
+logger = logging.getLogger(__name__)
+
+WAIT = registry.histogram(
+    'files_resizer_wait_seconds', 'Time of resize tasks waiting for a worker')
+DURATION = registry.histogram(
+    'files_resizer_duration_seconds', 'Time of resize tasks in worker')
+
+# What to do when queue of resizer is full
+OVERLOAD_UNAVAILABLE = 'unavailable'  # respond 503
+OVERLOAD_ORIGIN = 'origin'  # serve original image
+
+
+class ResizerOverloaded(Exception):
+    pass
+
+
+def run_timed(func, submitted_at, *args):
+    """
+    Runs func in worker process, returns seconds in queue,
+    seconds of run and result
+    """
+    started_at = time.time()
+    result = func(*args)
+    return started_at - submitted_at, time.time() - started_at, result
+
+
+async def unwrap_timed(future):
+    wait, duration, result = await future
+    WAIT.observe(max(wait, 0))
+    DURATION.observe(duration)
+    return result
+
+
+class Resizer:
+    """
+    Pool of worker processes to resize images.
+
+    Limits number of tasks waiting for a worker
+    and recreates the pool when it is broken.
+    """
+    def __init__(self, workers=None, queue_size=None):
+        self.workers = workers or os.cpu_count() or 1
+        if queue_size is None:
+            queue_size = 8 * self.workers
+        self.queue_size = queue_size
+        self.pending = 0
+        self.broken_counter = 0
+        self.overload_counter = 0
+        self._executor = None
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            workers=getattr(settings, 'FILES_RESIZE_WORKERS', None),
+            queue_size=getattr(settings, 'FILES_RESIZE_QUEUE_SIZE', None),
+        )
+
+    @property
+    def queued(self):
+        """Number of tasks waiting for a free worker"""
+        return max(self.pending - self.workers, 0)
+
+    @property
+    def full(self):
+        """Whether queue has no room for a task"""
+        return self.pending >= self.workers + self.queue_size
+
+    def get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def reset(self, executor=None):
+        """Drops the pool, new one is created on next submit"""
+        if executor is not None and executor is not self._executor:
+            return  # Already replaced
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            self.broken_counter += 1
+            executor.shutdown(wait=False)
+
+    def submit(self, loop, func, *args):
+        """
+        Runs func in worker process.
+        Raises ResizerOverloaded when queue is full
+        """
+        if self.full:
+            self.overload_counter += 1
+            raise ResizerOverloaded()
+        executor = self.get_executor()
+        # Clock of wall time is shared by worker processes
+        args = (func, time.time()) + args
+        try:
+            f = loop.run_in_executor(executor, run_timed, *args)
+        except BrokenProcessPool:
+            logger.error('Resizer pool is broken, restarting')
+            self.reset(executor)
+            executor = self.get_executor()
+            f = loop.run_in_executor(executor, run_timed, *args)
+        self.pending += 1
+        f.add_done_callback(functools.partial(self._done, executor))
+        return asyncio.ensure_future(unwrap_timed(f), loop=loop)
+
+    def _done(self, executor, future):
+        self.pending -= 1
+        if future.cancelled():
+            return
+        elif isinstance(future.exception(), BrokenProcessPool):
+            logger.error('Resizer pool is broken, restarting')
+            self.reset(executor)
+
+    def shutdown(self, wait=True):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def status(self):
+        return {
+            'workers': self.workers,
+            'pending': self.pending,
+            'queued': self.queued,
+            'queue_size': self.queue_size,
+            'broken': self.broken_counter,
+            'overloaded': self.overload_counter,
+        }
@@ -1,7 +1,11 @@
+import hashlib
 import logging
 import os
+import re
+import threading
 from uuid import uuid4
 
+from django.conf import settings
 from django.core.files.storage import FileSystemStorage
 from django.utils.encoding import force_text, force_str
 from django.utils.translation import ugettext_lazy as _
@@ -10,14 +14,51 @@ from .. import utils
 
 logger = logging.getLogger(__name__)
 
+# Created in directory of images after creation of all shard directories
+SHARDS_MARKER = '.shards'
+HEX_DIGITS = '0123456789abcdef'
+
+
+class HashingReader:
+    """File-like wrapper computing sha256 of data read from file"""
+    def __init__(self, file):
+        self.file = file
+        self.hash = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.hash.update(data)
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if offset == 0 and whence == os.SEEK_SET:
+            self.hash = hashlib.sha256()
+        return self.file.seek(offset, whence)
+
+    def tell(self):
+        return self.file.tell()
+
 
 class BaseStorage(FileSystemStorage):
     ERROR_CREATE_DIR = _('Error during creating a directory {0}')
+    # Key of storage in FILES_EAGER_RENDITIONS setting
+    renditions_key = None
+    default_renditions = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Directories known to exist
+        self.known_dirs = set()
+
+    def is_known_dir(self, path):
+        return path in self.known_dirs
 
     def create_dir(self, path):
         if not path.startswith(os.path.sep):  # is name?
             path = self.path(path)
         path = os.path.dirname(path)
+        if self.is_known_dir(path):
+            return
         try:
             if not os.path.exists(path):
                 os.makedirs(path)
@@ -36,8 +77,112 @@ class BaseStorage(FileSystemStorage):
             mime = magic.from_file(self.path(name), mime=True)
             return force_str(mime)
 
+    def save_hashed(self, name, content):
+        """Saves content and returns its name and sha256 hex digest"""
+        reader = HashingReader(getattr(content, 'file', content))
+        name = self.save(name, reader)
+        return name, reader.hash.hexdigest()
+
+    def link(self, source, name):
+        """
+        Makes name a hard link to file source, file of name is replaced.
+        Data is deleted from disk with the last of its names.
+        """
+        path = self.path(name)
+        self.create_dir(path)
+        tmp = path + '.tmp'
+        os.link(self.path(source), tmp)
+        os.replace(tmp, path)
+
+    @property
+    def renditions(self):
+        """Sizes (width, height) of renditions to create on upload"""
+        config = getattr(settings, 'FILES_EAGER_RENDITIONS', {})
+        return [
+            tuple(i) for i in
+            config.get(self.renditions_key, self.default_renditions)]
+
 
 class ImageStorage(BaseStorage):
+    renditions_key = 'image'
+    # Sizes of user picture and its 2x
+    default_renditions = ((150, 150), (300, 300))
+    prefix = 'image'
+    shard_re = re.compile(r'image/[0-9a-f]{2}/[0-9a-f]{2}$')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._shards_ready = False
+        self._shards_lock = threading.Lock()
+
+    @property
+    def precreate_shards(self):
+        """
+        With FILES_PRECREATE_SHARDS all shard directories are created
+        at once by command create_shards or on startup of application,
+        then saves skip directory checks and names with fresh uuid
+        are not checked for existence
+        """
+        return getattr(settings, 'FILES_PRECREATE_SHARDS', False)
+
+    def get_shards(self):
+        """Returns names of all shard directories"""
+        level = [a + b for a in HEX_DIGITS for b in HEX_DIGITS]
+        return [os.path.join(self.prefix, i, j) for i in level for j in level]
+
+    def create_shards(self):
+        """
+        Creates shard directories unless they are created already.
+        Returns whether directories are created
+        """
+        with self._shards_lock:
+            if self.shards_ready():
+                return False
+            for name in self.get_shards():
+                os.makedirs(self.path(name), exist_ok=True)
+            # Marker is written last, interrupted creation is repeated
+            with open(self.path(os.path.join(self.prefix, SHARDS_MARKER)), 'a'):
+                pass
+            self._shards_ready = True
+        return True
+
+    def shards_ready(self):
+        """Whether shard directories are created, marker is checked until they are"""
+        if not self._shards_ready:
+            self._shards_ready = os.path.exists(
+                self.path(os.path.join(self.prefix, SHARDS_MARKER)))
+        return self._shards_ready
+
+    def is_known_dir(self, path):
+        if self._shards_ready and path.startswith(self.location):
+            name = os.path.relpath(path, self.location)
+            if self.shard_re.match(name.replace(os.path.sep, '/')):
+                return True
+        return super().is_known_dir(path)
+
+    def _save(self, name, content):
+        if not self.precreate_shards or hasattr(content, 'temporary_file_path'):
+            return super()._save(name, content)
+        elif not self.shards_ready():
+            # Saves do not wait for creation of 65536 directories
+            return super()._save(name, content)
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        if not self.is_known_dir(directory):
+            name = super()._save(name, content)
+            self.known_dirs.add(directory)
+            return name
+        try:
+            fd = os.open(path, self.OS_OPEN_FLAGS, 0o666)
+        except (FileExistsError, FileNotFoundError):
+            # Default save picks another name and creates removed directory
+            return super()._save(name, content)
+        with os.fdopen(fd, 'wb') as f:
+            if self.file_permissions_mode is not None:
+                os.fchmod(fd, self.file_permissions_mode)
+            for chunk in content.chunks():
+                f.write(chunk)
+        return name
 
     def get_name(self, name, uuid=None):
         name_uuid = self.uuid(name)
@@ -56,7 +201,11 @@ class ImageStorage(BaseStorage):
         return os.path.join(os.path.dirname(name), basename)
 
     def get_available_name(self, name, max_length=None, uuid=None):
+        fresh = not uuid and not self.uuid(name)
         name = self.get_name(name, uuid)
+        if fresh and self.precreate_shards:
+            # Collision of random uuid4 is not worth a stat
+            return name
         while self.exists(name):
             name = self.get_name(name)
         return name
@@ -1,17 +1,50 @@
 from .. import utils
 from .storages import image_storage
 
+# Number of first bytes enough to sniff image type
+SNIFF_SIZE = 32
 
-async def save_image(app, user, filename, content, content_type):
-    name = await app.loop.run_in_executor(
-        None, image_storage.save, filename, content)
-    image_uuid = image_storage.uuid(name)
+
+def sniff_image_type(head):
+    """
+    Returns mime type of image by its first bytes or None
+
+    >>> sniff_image_type(b'\\x89PNG\\r\\n\\x1a\\n' + bytes(8))
+    'image/png'
+    >>> sniff_image_type(b'<svg>')
+    """
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    elif head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    elif head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    elif head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    elif head[4:8] == b'ftyp' and head[8:12] in (b'avif', b'avis'):
+        return 'image/avif'
+    elif head[:4] in (b'II*\x00', b'MM\x00*'):
+        return 'image/tiff'
+    elif head[:2] == b'BM':
+        return 'image/bmp'
+
+
+async def create_image(app, user, filename, content, content_type):
+    """Saves image file and returns created image model"""
     image = app.models.image
-    await image.create(
-        uuid=image_uuid,
+    name, meta = await image.save_file(filename, content)
+    obj = await image.create(
+        uuid=image_storage.uuid(name),
         image=name,
         mime_type=content_type,
+        meta=meta,
         author_id=user.id,
         created_at=utils.now(),
     )
-    return image_uuid
+    obj.schedule_renditions()
+    return obj
+
+
+async def save_image(app, user, filename, content, content_type):
+    obj = await create_image(app, user, filename, content, content_type)
+    return obj.uuid
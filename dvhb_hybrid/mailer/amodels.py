@@ -12,6 +12,50 @@ class MailMessage(Model):
     @classmethod
     def set_defaults(cls, data: dict):
         data.setdefault('created_at', utils.now())
+        # Column has no default in database
+        data.setdefault('attempts', 0)
+
+    @classmethod
+    @method_connect_once
+    async def create_many(cls, objects, connection=None):
+        """Inserts objects with the same fields by one statement"""
+        if not objects:
+            return []
+        for obj in objects:
+            cls.set_defaults(obj)
+        result = []
+        async for row in await connection.execute(
+                cls.table.insert().values(objects).returning(*cls.table.c)):
+            result.append(cls(**row))
+        await cls.invalidate_response_cache()
+        return result
+
+    @classmethod
+    async def claim_unsent(cls, limit, max_attempts, *, connection):
+        """
+        Locks unsent messages till the end of transaction of connection.
+        Messages locked by other workers are skipped
+        """
+        t = cls.table
+        sql = t.select().where(
+            t.c.sent_at.is_(None) & (t.c.attempts < max_attempts)
+        ).order_by(t.c.id).limit(limit).with_for_update(skip_locked=True)
+        result = []
+        async for row in await connection.execute(sql):
+            result.append(cls(**row))
+        return result
+
+    @classmethod
+    async def mark_sent(cls, ids, connection=None):
+        if ids:
+            await cls.update_fields(
+                cls.table.c.id.in_(ids), sent_at=utils.now(), connection=connection)
+
+    @classmethod
+    async def mark_failed(cls, ids, connection=None):
+        if ids:
+            await cls.update_fields(
+                cls.table.c.id.in_(ids), attempts=cls.table.c.attempts + 1, connection=connection)
 
 
 class EmailTemplate(Model):
@@ -24,9 +68,7 @@ class EmailTemplate(Model):
 
     @method_connect_once
     async def get_translation(self, lang_code='en', connection=None):
-        trans = self.models['email_template_translation']
-        if trans.app is None:  # warm up
-            trans = trans.factory(self.app)
+        trans = self.app.models.email_template_translation
         return await trans.get_template_translation(
             self.id, lang_code, connection=connection)
 
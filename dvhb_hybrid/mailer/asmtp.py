@@ -0,0 +1,312 @@
+import asyncio
+import base64
+import collections
+import logging
+import ssl
+from email.mime.text import MIMEText
+
+from . import base
+
+logger = logging.getLogger('mailer')
+
+
+class SMTPError(Exception):
+    def __init__(self, code, message):
+        super().__init__(code, message)
+        self.code = code
+        self.message = message
+
+
+class SMTPProtocol(asyncio.Protocol):
+    """
+    Splits data from server into replies.
+    Replies are given to waiters in order of commands,
+    so commands may be written before replies of previous ones
+    """
+    def __init__(self, loop):
+        self.loop = loop
+        self.transport = None
+        self.buffer = b''
+        self.lines = []
+        self.replies = collections.deque()
+        self.waiters = collections.deque()
+        self.exc = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.buffer += data
+        while True:
+            line, sep, rest = self.buffer.partition(b'\n')
+            if not sep:
+                return
+            self.buffer = rest
+            line = line.rstrip(b'\r')
+            self.lines.append(line[4:].decode('utf-8', 'replace'))
+            if line[3:4] == b'-':
+                continue
+            try:
+                code = int(line[:3])
+            except ValueError:
+                code = 0
+            reply = code, '\n'.join(self.lines)
+            self.lines = []
+            if self.waiters:
+                waiter = self.waiters.popleft()
+                if not waiter.done():
+                    waiter.set_result(reply)
+            else:
+                self.replies.append(reply)
+
+    def connection_lost(self, exc):
+        self.transport = None
+        self.exc = ConnectionError('Connection closed by server')
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_exception(self.exc)
+
+    @property
+    def connected(self):
+        return self.transport is not None and not self.transport.is_closing()
+
+    def get_reply(self):
+        """Returns future of next reply"""
+        waiter = self.loop.create_future()
+        if self.replies:
+            waiter.set_result(self.replies.popleft())
+        elif not self.connected:
+            waiter.set_exception(self.exc or ConnectionError('Not connected'))
+        else:
+            self.waiters.append(waiter)
+        return waiter
+
+    def write(self, line):
+        """Writes command and returns future of its reply"""
+        if not self.connected:
+            raise ConnectionError('Not connected')
+        self.transport.write(line)
+        return self.get_reply()
+
+
+def dot_stuff(data):
+    """
+    Returns message data terminated for DATA command
+
+    >>> dot_stuff(b'a\\n.b\\r\\n')
+    b'a\\r\\n..b\\r\\n.\\r\\n'
+    """
+    lines = data.replace(b'\r\n', b'\n').split(b'\n')
+    if lines[-1] == b'':
+        lines.pop()
+    lines = [b'.' + i if i.startswith(b'.') else i for i in lines]
+    return b'\r\n'.join(lines) + b'\r\n.\r\n'
+
+
+class SMTPConnection(base.BaseConnection):
+    """
+    SMTP client on the event loop.
+
+    Options of conf.mta: host, port, timeout, ssl for implicit TLS,
+    starttls, username and password for AUTH PLAIN, keepalive seconds
+    between NOOP probes of idle connection and idle_timeout seconds
+    to QUIT idle connection.
+    Connection is kept open between batches of the mailer,
+    envelope commands are pipelined when server supports PIPELINING.
+    """
+    reusable = True
+
+    def __init__(self, loop, conf, **kwargs):
+        super().__init__(**kwargs)
+        self.loop = loop
+        self.conf = conf
+        mta = conf.get('mta') or {}
+        self.host = mta.get('host', 'localhost')
+        self.port = mta.get('port', 25)
+        self.timeout = mta.get('timeout', 60)
+        self.ssl = mta.get('ssl', False)
+        self.starttls = mta.get('starttls', False)
+        self.username = mta.get('username')
+        self.password = mta.get('password')
+        self.keepalive = mta.get('keepalive', 30)
+        self.idle_timeout = mta.get('idle_timeout', 300)
+        self.protocol = None
+        self.extensions = {}
+        self.last_activity = 0
+        self._keepalive_task = None
+
+    @property
+    def connected(self):
+        return self.protocol is not None and self.protocol.connected
+
+    @property
+    def pipelining(self):
+        return 'pipelining' in self.extensions
+
+    def get_ssl_context(self):
+        return ssl.create_default_context()
+
+    async def wait_reply(self, waiter, expect=(250,)):
+        try:
+            code, message = await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            # State of dialog is unknown
+            self.abort()
+            raise
+        self.last_activity = self.loop.time()
+        if expect is not None and code not in expect:
+            raise SMTPError(code, message)
+        return code, message
+
+    async def command(self, line, expect=(250,)):
+        return await self.wait_reply(
+            self.protocol.write(line.encode() + b'\r\n'), expect)
+
+    async def ehlo(self):
+        _, message = await self.command('EHLO ' + self.conf.get('local_hostname', 'localhost'))
+        self.extensions = {}
+        for line in message.split('\n')[1:]:
+            keyword, _, params = line.partition(' ')
+            self.extensions[keyword.lower()] = params
+
+    async def connect(self):
+        self.protocol = SMTPProtocol(self.loop)
+        await asyncio.wait_for(self.loop.create_connection(
+            lambda: self.protocol, self.host, self.port,
+            ssl=self.get_ssl_context() if self.ssl else None,
+        ), self.timeout)
+        await self.wait_reply(self.protocol.get_reply(), (220,))
+        await self.ehlo()
+        if self.starttls:
+            await self.start_tls()
+        if self.username:
+            auth = '\0{}\0{}'.format(self.username, self.password).encode()
+            await self.command(
+                'AUTH PLAIN ' + base64.b64encode(auth).decode(), (235,))
+
+    async def start_tls(self):
+        if 'starttls' not in self.extensions:
+            raise SMTPError(0, 'Server does not support STARTTLS')
+        # Available since Python 3.7
+        start_tls = getattr(self.loop, 'start_tls', None)
+        if start_tls is None:
+            raise RuntimeError('STARTTLS is not supported by event loop')
+        await self.command('STARTTLS', (220,))
+        transport = await start_tls(
+            self.protocol.transport, self.protocol,
+            self.get_ssl_context(), server_hostname=self.host)
+        self.protocol.transport = transport
+        await self.ehlo()
+
+    async def noop(self):
+        await self.command('NOOP')
+
+    async def open(self):
+        self.stop_keepalive()
+        if self.connected:
+            # Without keepalive connection is probed on every open
+            if self.keepalive and self.loop.time() - self.last_activity < self.keepalive:
+                return self
+            try:
+                await self.noop()
+                return self
+            except (SMTPError, ConnectionError, asyncio.TimeoutError):
+                logger.info('SMTP connection is dead, reconnecting')
+                self.abort()
+        await self.connect()
+        return self
+
+    def abort(self):
+        if self.protocol is not None and self.protocol.transport is not None:
+            self.protocol.transport.close()
+        self.protocol = None
+
+    async def close(self):
+        self.stop_keepalive()
+        if self.connected:
+            try:
+                await self.command('QUIT', (221,))
+            except (SMTPError, ConnectionError, asyncio.TimeoutError):
+                pass
+        self.abort()
+
+    def stop_keepalive(self):
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            self._keepalive_task = None
+
+    async def keep_alive(self):
+        """Probes idle connection by NOOP and closes it after idle_timeout"""
+        idle_since = self.loop.time()
+        while self.connected:
+            await asyncio.sleep(self.keepalive)
+            if self.loop.time() - idle_since >= self.idle_timeout:
+                self._keepalive_task = None
+                await self.close()
+                return
+            try:
+                # Reply of NOOP is awaited even if the connection is taken
+                await asyncio.shield(self.noop())
+            except (SMTPError, ConnectionError, asyncio.TimeoutError):
+                self.abort()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None or not self.connected:
+            await self.close()
+        elif self.keepalive and self._keepalive_task is None:
+            self._keepalive_task = asyncio.ensure_future(
+                self.keep_alive(), loop=self.loop)
+
+    def make_message(self, message):
+        msg = MIMEText(message.body)
+        msg['To'] = ', '.join(message.mail_to)
+        msg['Subject'] = message.subject
+        msg['From'] = self.conf.from_email
+        return msg.as_bytes(policy=msg.policy.clone(linesep='\r\n'))
+
+    async def send_message(self, message):
+        if not message.mail_to:
+            raise ValueError('Message has no recipients')
+        elif not self.connected:
+            raise ConnectionError()
+        data = dot_stuff(self.make_message(message))
+        mail = 'MAIL FROM:<{}>'.format(self.conf.from_email)
+        rcpts = ['RCPT TO:<{}>'.format(i) for i in message.mail_to]
+        if self.pipelining:
+            waiters = [
+                self.protocol.write(i.encode() + b'\r\n')
+                for i in [mail] + rcpts + ['DATA']]
+            replies = []
+            for waiter in waiters:
+                replies.append(await self.wait_reply(waiter, None))
+        else:
+            replies = [await self.command(mail, None)]
+            if replies[0][0] == 250:
+                for i in rcpts:
+                    replies.append(await self.command(i, None))
+        rcpt_replies = replies[1:len(rcpts) + 1]
+        rejected = [i for i in rcpt_replies if i[0] not in (250, 251)]
+        error = None
+        if replies[0][0] != 250:
+            error = SMTPError(*replies[0])
+        elif len(rejected) == len(rcpt_replies):
+            error = SMTPError(*rejected[0])
+        elif not self.pipelining:
+            replies.append(await self.command('DATA', None))
+        code, text = replies[-1] if len(replies) == len(rcpts) + 2 else (None, '')
+        if error is not None:
+            if code == 354:
+                # Server ignores failed envelope, message can not be ended safely
+                self.abort()
+            else:
+                await self.command('RSET')
+            raise error
+        elif code != 354:
+            await self.command('RSET')
+            raise SMTPError(code, text)
+        await self.wait_reply(self.protocol.write(data))
+
+
+class Mailer(base.BaseMailer):
+    connection_class = SMTPConnection
@@ -1,5 +1,7 @@
 import asyncio
+import collections
 import logging
+import sys
 from collections import Mapping
 
 from aioworkers.core.config import MergeDict
@@ -15,6 +17,9 @@ logger = logging.getLogger('mailer')
 
 
 class BaseConnection:
+    # Connection stays open after batch and is used for next one
+    reusable = False
+
     def __init__(self, **kwargs):
         self.kwargs = kwargs
 
@@ -73,28 +78,192 @@ class BaseMailer(Worker):
         self.restart_counter = 0
         self.exception_counter = 0
         self.connect_counter = 0
+        # Senders draining the queue, each with own connection
+        self.workers = self.config.get('workers', 1)
+        self.worker_counters = [
+            collections.Counter() for _ in range(self.workers)]
         self.queue = asyncio.Queue(loop=self.loop)
+        # Saved messages are sent from table by workers of all processes,
+        # queue keeps only messages which are not saved
+        self.outbox = self.config.get('outbox', False)
+        self.batch_size = self.config.get('batch_size', 100)
+        self.poll_interval = self.config.get('poll_interval', 10)
+        self.max_attempts = self.config.get('max_attempts', 5)
+        self.outbox_event = asyncio.Event(loop=self.loop)
 
     async def run(self, *args):
+        senders = [
+            asyncio.ensure_future(self.sender(i), loop=self.loop)
+            for i in range(self.workers)]
+        if self.outbox:
+            senders.extend(
+                asyncio.ensure_future(self.outbox_sender(i), loop=self.loop)
+                for i in range(self.workers))
+        try:
+            await asyncio.gather(*senders)
+        finally:
+            for i in senders:
+                i.cancel()
+
+    async def sender(self, number):
+        counter = self.worker_counters[number]
+        connection = None
+        try:
+            while True:
+                msg = await self.queue.get()
+                if connection is None or not connection.reusable:
+                    connection = self.get_connection()
+                try:
+                    await self.send_batch(msg, connection, counter)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    # Messages of batch are done, worker goes on
+                    logger.exception('Mailer batch failed')
+                    self.exception_counter += 1
+        finally:
+            if connection is not None and connection.reusable:
+                await connection.close()
+
+    async def open_connection(self, connection, counter):
+        """Opens connection, waits for server while it is unavailable"""
+        delay = 2
         while True:
-            msg = await self.queue.get()
-            async with self.get_connection() as conn:
-                self.connect_counter += 1
-                while True:
-                    try:
-                        await self.send_message(msg, conn)
-                        self.mail_success += 1
-                    except:
-                        self.mail_failed += 1
-                        await conn.close()
-                        logger.exception('Mailer reconnect')
-                        self.reconnect_counter += 1
-                        await asyncio.sleep(2)
-                        await conn.open()
+            try:
+                return await connection.open()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Mailer connect failed')
+                self.exception_counter += 1
+                counter['connect_failed'] += 1
+            await asyncio.sleep(delay)
+            delay = min(2 * delay, 60)
+
+    async def send_batch(self, msg, connection, counter):
+        """Sends message and others from queue until it is empty"""
+        conn = await self.open_connection(connection, counter)
+        self.connect_counter += 1
+        counter['connect'] += 1
+        sent = []
+        exc_info = None, None, None
+        try:
+            while True:
+                try:
+                    await conn.send_message(msg)
+                    sent.append(msg)
+                    self.mail_success += 1
+                    counter['success'] += 1
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    self.mail_failed += 1
+                    counter['failed'] += 1
+                    await conn.close()
+                    logger.exception('Mailer reconnect')
+                    self.reconnect_counter += 1
+                    counter['reconnect'] += 1
+                    await asyncio.sleep(2)
+                    await self.open_connection(conn, counter)
+                finally:
+                    self.queue.task_done()
+                if len(sent) >= self.batch_size:
+                    await self.flush_sent(sent)
+                    sent = []
+                try:
+                    msg = self.queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+        except BaseException:
+            exc_info = sys.exc_info()
+            raise
+        finally:
+            # Delivered messages are marked even if batch is interrupted
+            await self.flush_sent(sent)
+            await conn.__aexit__(*exc_info)
+
+    async def flush_sent(self, messages):
+        try:
+            await self.mark_sent(messages)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception('Mailer failed to mark sent messages')
+            self.exception_counter += 1
+
+    async def outbox_sender(self, number):
+        """Sends unsent messages from table, pending ones first"""
+        counter = self.worker_counters[number]
+        connection = None
+        try:
+            while True:
+                self.outbox_event.clear()
+                if connection is None or not connection.reusable:
+                    connection = self.get_connection()
+                try:
+                    claimed = await self.send_outbox(connection, counter)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    logger.exception('Mailer outbox')
+                    self.exception_counter += 1
+                    claimed = 0
+                if claimed < self.batch_size:
                     try:
-                        msg = self.queue.get_nowait()
-                    except asyncio.QueueEmpty:
-                        break
+                        await asyncio.wait_for(
+                            self.outbox_event.wait(), self.poll_interval, loop=self.loop)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            if connection is not None and connection.reusable:
+                await connection.close()
+
+    async def send_outbox(self, connection, counter):
+        """
+        Claims batch of unsent messages, sends them and marks them in bulk.
+        Rows are locked till commit so other workers take next ones,
+        messages of interrupted batch are sent again.
+        Returns number of claimed messages
+        """
+        model = self.app.models.mail_message
+        async with self.app['db'].acquire() as db:
+            async with db.begin():
+                messages = await model.claim_unsent(
+                    self.batch_size, self.max_attempts, connection=db)
+                if not messages:
+                    return 0
+                sent, failed = [], []
+                async with connection as conn:
+                    self.connect_counter += 1
+                    counter['connect'] += 1
+                    for message in messages:
+                        try:
+                            await conn.send_message(message)
+                            sent.append(message.pk)
+                            self.mail_success += 1
+                            counter['success'] += 1
+                        except asyncio.CancelledError:
+                            raise
+                        except Exception:
+                            failed.append(message.pk)
+                            self.mail_failed += 1
+                            counter['failed'] += 1
+                            await conn.close()
+                            logger.exception('Mailer reconnect')
+                            self.reconnect_counter += 1
+                            counter['reconnect'] += 1
+                            await asyncio.sleep(2)
+                            try:
+                                await conn.open()
+                            except asyncio.CancelledError:
+                                raise
+                            except Exception:
+                                # Rest of batch is released for next claim
+                                logger.exception('Mailer reconnect failed')
+                                break
+                await model.mark_sent(sent, connection=db)
+                await model.mark_failed(failed, connection=db)
+        return len(messages)
 
     async def monitor(self, request):
         return dict(
@@ -106,7 +275,9 @@ class BaseMailer(Worker):
             restart_counter=self.restart_counter,
             exception_counter=self.exception_counter,
             queue=self.queue.qsize(),
+            outbox=self.outbox,
             backend=self.config.cls,
+            workers=[dict(i) for i in self.worker_counters],
         )
 
     def get_connection(self):
@@ -174,27 +345,54 @@ class BaseMailer(Worker):
         if not isinstance(mail_to, list):
             mail_to = mail_to.split(',')
 
-        for recipient in mail_to:
-            kwargs = dict(
-                mail_to=[recipient],
-                body=body.render(context, mail_to=recipient),
-                subject=subject.render(context, mail_to=recipient),
-                template=template,
-                html=html and html.render(context, mail_to=recipient),
-                attachments=attachments,
-            )
+        model = self.app.models.mail_message
+        # Messages of chunk are inserted by one statement
+        for i in range(0, len(mail_to), self.batch_size):
+            messages = [
+                dict(
+                    mail_to=[recipient],
+                    body=body.render(context, mail_to=recipient),
+                    subject=subject.render(context, mail_to=recipient),
+                    template=template,
+                    html=html and html.render(context, mail_to=recipient),
+                    attachments=attachments,
+                )
+                for recipient in mail_to[i:i + self.batch_size]
+            ]
+            if connection:
+                # Sent right here, outbox workers do not claim them
+                for message in messages:
+                    message['attempts'] = self.max_attempts
             if save:
-                message = await self.app.models.mail_message.create(
-                    **kwargs, connection=db_connection)
+                messages = await model.create_many(messages, connection=db_connection)
             else:
-                message = self.app.models.mail_message(**kwargs)
+                messages = [model(**kwargs) for kwargs in messages]
 
-            if not connection:
-                self.queue.put_nowait(message)
+            if connection:
+                delivered = []
+                try:
+                    for message in messages:
+                        await connection.send_message(message)
+                        delivered.append(message)
+                finally:
+                    # Delivered part of interrupted chunk is not sent again
+                    await self.mark_sent(delivered, connection=db_connection)
+            elif self.outbox and save:
+                self.outbox_event.set()
             else:
-                await self.send_message(message, connection)
+                for message in messages:
+                    self.queue.put_nowait(message)
         return len(mail_to)
 
+    async def mark_sent(self, messages, connection=None):
+        """Sets sent_at of messages by one update"""
+        now = utils.now()
+        for message in messages:
+            message.sent_at = now
+        pks = [i.pk for i in messages if i.pk]
+        if pks:
+            await self.app.models.mail_message.mark_sent(pks, connection=connection)
+
     async def send_message(self, message, connection):
         await connection.send_message(message)
         message.sent_at = utils.now()
@@ -10,12 +10,12 @@ class DjangoConnection(base.BaseConnection):
     def __init__(self, loop, conf, **kwargs):
         super().__init__(**kwargs)
         self.loop = loop
-        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.executor = None
         self._conn = None
         self.conf = conf
 
     async def send_message(self, message):
-        if not self._conn:
+        if not self._conn or self.executor is None:
             raise ConnectionError()
         kwargs = dict(
             subject=message.subject,
@@ -52,12 +52,19 @@ class DjangoConnection(base.BaseConnection):
         return await self.loop.run_in_executor(self.executor, msg.send)
 
     async def close(self):
-        if self._conn:
-            await self.loop.run_in_executor(
-                self.executor, self._conn.close)
+        if self.executor is None:
+            return
+        executor, self.executor = self.executor, None
+        try:
+            if self._conn:
+                await self.loop.run_in_executor(executor, self._conn.close)
+        finally:
+            # Thread of connection is started again by open
+            executor.shutdown(wait=False)
 
     async def open(self):
         await self.close()
+        self.executor = ThreadPoolExecutor(max_workers=1)
         if not self._conn:
             params = {
                 'backend': self.conf.get('django_email_backend'),
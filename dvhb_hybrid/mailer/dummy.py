@@ -1,3 +1,4 @@
+import asyncio
 from email.mime.text import MIMEText
 
 from . import base
@@ -15,6 +16,10 @@ class Connection(base.BaseConnection):
         msg['To'] = ', '.join(message.mail_to)
         msg['Subject'] = message.subject
         msg['From'] = self.conf.from_email
+        # Simulated round trip to server
+        latency = self.conf.get('latency')
+        if latency:
+            await asyncio.sleep(latency)
         self.messages.append(msg)
 
     async def open(self):
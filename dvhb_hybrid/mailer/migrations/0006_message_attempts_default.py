@@ -0,0 +1,16 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailer', '0005_message_attempts'),
+    ]
+
+    operations = [
+        # Rows inserted by other writers than Django get zero too
+        migrations.RunSQL(
+            'ALTER TABLE mailer_message ALTER COLUMN attempts SET DEFAULT 0',
+            'ALTER TABLE mailer_message ALTER COLUMN attempts DROP DEFAULT',
+        ),
+    ]
@@ -17,6 +17,8 @@ class Message(models.Model):
     template = models.CharField(max_length=255, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     sent_at = models.DateTimeField(null=True)
+    # Failed sendings from outbox
+    attempts = models.PositiveSmallIntegerField(default=0)
     attachments = JSONField(default={}, blank=True, null=True)
 
 
@@ -11,11 +11,11 @@ class SMTPConnection(base.BaseConnection):
         super().__init__(**kwargs)
         self._conn = None
         self.loop = loop
-        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.executor = None
         self.conf = conf
 
     async def send_message(self, message):
-        if not self._conn:
+        if not self._conn or self.executor is None:
             raise ConnectionError()
         msg = MIMEText(message.body)
         msg['To'] = ', '.join(message.mail_to)
@@ -26,6 +26,7 @@ class SMTPConnection(base.BaseConnection):
 
     async def open(self):
         await self.close()
+        self.executor = ThreadPoolExecutor(max_workers=1)
         if not self._conn:
             self._conn = smtplib.SMTP()
         connect = partial(self._conn.connect, **self.conf.mta)
@@ -33,9 +34,15 @@ class SMTPConnection(base.BaseConnection):
         return self
 
     async def close(self):
-        if self._conn:
-            await self.loop.run_in_executor(
-                self.executor, self._conn.close)
+        if self.executor is None:
+            return
+        executor, self.executor = self.executor, None
+        try:
+            if self._conn:
+                await self.loop.run_in_executor(executor, self._conn.close)
+        finally:
+            # Thread of connection is started again by open
+            executor.shutdown(wait=False)
 
 
 class Mailer(base.BaseMailer):
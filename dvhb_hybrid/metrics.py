@@ -0,0 +1,230 @@
+import bisect
+import collections
+import math
+import time
+
+from aiohttp import web
+
+# Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (
+    .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(k, escape(v)) for k, v in pairs) + '}'
+
+
+def format_value(value):
+    """
+    >>> format_value(3), format_value(0.5), format_value(math.inf)
+    ('3', '0.5', '+Inf')
+    """
+    if isinstance(value, int):
+        return str(value)
+    elif math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+class Timer:
+    """Context manager passing seconds of its block to observe"""
+    def __init__(self, observe):
+        self.observe = observe
+        self.started_at = None
+
+    def __enter__(self):
+        self.started_at = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.observe(time.monotonic() - self.started_at)
+
+
+class CounterValue:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def set(self, value):
+        """Sets total counted elsewhere, like hits of a cache"""
+        self.value = value
+
+    def samples(self):
+        yield '_total', (), self.value
+
+
+class GaugeValue(CounterValue):
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def samples(self):
+        yield '', (), self.value
+
+
+class HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+
+    def time(self):
+        return Timer(self.observe)
+
+    def samples(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield '_bucket', (('le', format_value(bound)),), total
+        yield '_bucket', (('le', '+Inf'),), self.count
+        yield '_sum', (), self.sum
+        yield '_count', (), self.count
+
+
+class Metric:
+    """
+    Metric with values by label values.
+    Methods of value without labels are available on metric
+    """
+    type = None
+
+    def __init__(self, name, help='', labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def create_value(self):
+        raise NotImplementedError()
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(str(kwargs[i]) for i in self.labelnames)
+        else:
+            values = tuple(str(i) for i in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError('Metric {} has labels {}'.format(self.name, self.labelnames))
+        value = self._values.get(values)
+        if value is None:
+            value = self._values[values] = self.create_value()
+        return value
+
+    @property
+    def value(self):
+        return self.labels().value
+
+    def expose(self):
+        yield '# HELP {} {}'.format(self.name, self.help.replace('\n', ' '))
+        yield '# TYPE {} {}'.format(self.name, self.type)
+        for values, value in sorted(self._values.items()):
+            labels = tuple(zip(self.labelnames, values))
+            for suffix, extra, v in value.samples():
+                yield '{}{}{} {}'.format(
+                    self.name, suffix, format_labels(labels + extra), format_value(v))
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def create_value(self):
+        return CounterValue()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def create_value(self):
+        return GaugeValue()
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help='', labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def create_value(self):
+        return HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+
+class Registry:
+    """
+    Metrics of process by name. Collectors are called before
+    exposition to update metrics from other sources
+    """
+    def __init__(self):
+        self.metrics = collections.OrderedDict()
+        self.collectors = []
+
+    def get_or_create(self, cls, name, *args, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, *args, **kwargs)
+        elif type(metric) is not cls:
+            raise ValueError('Metric {} is {}'.format(name, metric.type))
+        return metric
+
+    def counter(self, name, help='', labelnames=()):
+        return self.get_or_create(Counter, name, help, labelnames)
+
+    def gauge(self, name, help='', labelnames=()):
+        return self.get_or_create(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help='', labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.get_or_create(Histogram, name, help, labelnames, buckets)
+
+    def add_collector(self, func):
+        if func not in self.collectors:
+            self.collectors.append(func)
+
+    def expose(self):
+        """Returns metrics in Prometheus text format"""
+        for func in self.collectors:
+            func()
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+async def metrics_handler(request):
+    """Monitor route with metrics of process for Prometheus"""
+    return web.Response(
+        body=registry.expose().encode(),
+        headers={'Content-Type': CONTENT_TYPE})
@@ -0,0 +1,43 @@
+import time
+
+from aiohttp.web_exceptions import HTTPException
+
+from dvhb_hybrid.metrics import registry
+
+REQUEST_DURATION = registry.histogram(
+    'http_request_duration_seconds', 'Time of handling requests by endpoint',
+    labelnames=('endpoint', 'method'))
+REQUESTS = registry.counter(
+    'http_requests', 'Handled requests by endpoint and status',
+    labelnames=('endpoint', 'method', 'status'))
+
+
+def get_endpoint(request):
+    """Returns name of route or pattern of its path"""
+    route = request.match_info.route
+    if route.name:
+        return route.name
+    resource = route.resource
+    if resource is None:
+        return 'unmatched'
+    info = resource.get_info()
+    return info.get('formatter') or info.get('path') or info.get('prefix') or 'unknown'
+
+
+async def metrics_factory(app, handler):
+    async def metrics_middleware(request):
+        started_at = time.monotonic()
+        status = 500
+        try:
+            response = await handler(request)
+            status = response.status
+            return response
+        except HTTPException as e:
+            status = e.status
+            raise
+        finally:
+            endpoint = get_endpoint(request)
+            REQUEST_DURATION.labels(endpoint, request.method).observe(
+                time.monotonic() - started_at)
+            REQUESTS.labels(endpoint, request.method, status).inc()
+    return metrics_middleware
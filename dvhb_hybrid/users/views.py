@@ -3,6 +3,7 @@ from django.contrib.auth.hashers import check_password, make_password
 
 from .. import exceptions
 from ..amodels import method_redis_once, method_connect_once
+from ..cache import conditional
 from ..decorators import recaptcha
 from ..permissions import permissions, gen_api_key
 from ..redis import redis_key
@@ -139,6 +140,7 @@ async def cancel_deletion(request, confirmation_code, connection=None):
 
 
 @permissions
+@conditional(lambda request: request.user.get_etag())
 async def get_profile(request):
     user = request.user
     return await user.get_profile()
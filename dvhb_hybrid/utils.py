@@ -123,6 +123,16 @@ def hash_data(data):
     return m.hexdigest()
 
 
+def make_etag(*data):
+    """
+    Generates ETag header value from data
+
+    >>> make_etag('h', 43)
+    '"e2de391295334b9b27272e6517ed047a"'
+    """
+    return '"{}"'.format(hash_data(list(data)))
+
+
 def import_class(py_path):
     path, class_name = py_path.rsplit('.', 1)
     module = importlib.import_module(path)
@@ -34,6 +34,7 @@ class Application(aioworkers.http.Application):
         dbparams = self.config.databases.default
         self['db'] = await aiopg.sa.create_engine(**dbparams)
         self.models = self.m = AppModels(self)
+        self.m.warm_up()
 
     async def cleanup_database(self):
         self['db'].close()
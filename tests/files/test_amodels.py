@@ -0,0 +1,91 @@
+import inspect
+import uuid
+
+import pytest
+from aiohttp import web
+
+from dvhb_hybrid.files import amodels
+
+PNG = b'\x89PNG\r\n\x1a\n' + bytes(100)
+
+
+@pytest.fixture
+def image_server(loop, test_server):
+    async def handler(request):
+        return web.Response(
+            body=request.app['bodies'][request.match_info['name']],
+            content_type='image/png')
+
+    async def stream(request):
+        # Chunked response without Content-Length
+        response = web.StreamResponse()
+        response.content_type = 'image/png'
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        body = request.app['bodies'][request.match_info['name']]
+        for i in range(0, len(body), 100):
+            result = response.write(body[i:i + 100])
+            if inspect.isawaitable(result):
+                await result
+        return response
+
+    async def create(**bodies):
+        app = web.Application(loop=loop)
+        app['bodies'] = bodies
+        app.router.add_get('/{name}', handler)
+        app.router.add_get('/stream/{name}', stream)
+        return await test_server(app)
+    return create
+
+
+@pytest.mark.parametrize('body', [b'<svg></svg>', b'GIF', PNG * 10])
+async def test_from_url_rejected(app, image_server, mocker, monkeypatch, body):
+    monkeypatch.setattr(amodels.settings, 'FILES_DOWNLOAD_MAX_SIZE', 1000, raising=False)
+    monkeypatch.setattr(amodels.settings, 'FILES_DOWNLOAD_CHUNK_SIZE', 16, raising=False)
+    save = mocker.patch.object(amodels.image_storage, 'save')
+    server = await image_server(a=body)
+    result = await app.models.image.from_url(server.make_url('/a'), user=mocker.Mock())
+    assert result is None
+    assert not save.called
+
+
+async def test_from_url_stream_over_limit(app, image_server, mocker, monkeypatch):
+    monkeypatch.setattr(amodels.settings, 'FILES_DOWNLOAD_MAX_SIZE', 1000, raising=False)
+    monkeypatch.setattr(amodels.settings, 'FILES_DOWNLOAD_CHUNK_SIZE', 16, raising=False)
+    save = mocker.patch.object(amodels.image_storage, 'save')
+    server = await image_server(a=PNG * 20)
+    result = await app.models.image.from_url(server.make_url('/stream/a'), user=mocker.Mock())
+    assert result is None
+    assert not save.called
+
+
+@pytest.mark.parametrize('path', ['/a', '/stream/a'])
+async def test_from_url(app, image_server, mocker, monkeypatch, path):
+    monkeypatch.setattr(amodels.settings, 'FILES_DOWNLOAD_MAX_SIZE', 1000, raising=False)
+    monkeypatch.setattr(amodels.settings, 'FILES_DOWNLOAD_CHUNK_SIZE', 16, raising=False)
+    name = 'image/ab/cd/{}.png'.format(uuid.uuid4())
+    saved = {}
+
+    async def save_file(filename, content, **kwargs):
+        saved[filename] = content.read()
+        return name, {}
+
+    async def create(**kwargs):
+        return amodels.Image(**kwargs)
+
+    mocker.patch.object(amodels.Image, 'save_file', side_effect=save_file)
+    mocker.patch.object(amodels.Image, 'create', side_effect=create)
+    mocker.patch.object(amodels.Image, 'schedule_renditions')
+    server = await image_server(a=PNG)
+    result = await app.models.image.from_url(server.make_url(path), user=mocker.Mock(pk=1))
+    assert result.image == name
+    assert result.mime_type == 'image/png'
+    assert saved == {'a.png': PNG}
+
+
+def test_schedule_negotiated_renditions(mocker, monkeypatch):
+    monkeypatch.setattr(amodels.image, 'output_formats', ['WEBP'])
+    mocker.patch.object(amodels.image, 'schedule')
+    create = mocker.patch.object(amodels.Image, 'create_renditions')
+    amodels.Image(meta={'renditions': ['150x150']}).schedule_renditions()
+    create.assert_called_once_with([(300, 300), (150, 150, 'WEBP'), (300, 300, 'WEBP')])
@@ -0,0 +1,127 @@
+import hashlib
+import io
+import os
+
+import pytest
+from aiohttp import web
+
+from dvhb_hybrid.files import astorages
+from dvhb_hybrid.files.astorages import LocalStorage, ObjectStorage
+from dvhb_hybrid.files.storages import ImageStorage
+
+DATA = b'\x89PNG\r\n\x1a\n' + bytes(100)
+
+
+async def object_handler(request):
+    """Stand-in of S3 object API keeping objects in memory"""
+    objects = request.app['objects']
+    key = request.match_info['key']
+    if request.method == 'PUT':
+        source = request.headers.get('x-amz-copy-source')
+        if source:
+            objects[key] = objects[source.split('/', 2)[2]]
+        else:
+            objects[key] = await request.read()
+        return web.Response()
+    elif key not in objects:
+        return web.Response(status=404)
+    elif request.method == 'DELETE':
+        del objects[key]
+        return web.Response(status=204)
+    return web.Response(body=objects[key])
+
+
+async def list_handler(request):
+    prefix = request.rel_url.query.get('prefix', '')
+    keys = sorted(k for k in request.app['objects'] if k.startswith(prefix))
+    body = ''.join('<Contents><Key>{}</Key></Contents>'.format(k) for k in keys)
+    return web.Response(
+        text='<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+             '<IsTruncated>false</IsTruncated>{}</ListBucketResult>'.format(body),
+        content_type='application/xml')
+
+
+@pytest.fixture
+def object_storage(loop, test_server, test_client):
+    async def create():
+        app = web.Application(loop=loop)
+        app['objects'] = {}
+        app.router.add_get('/bucket/', list_handler)
+        app.router.add_route('*', '/bucket/{key:.+}', object_handler)
+        client = await test_client(app)
+        storage = ObjectStorage(
+            str(client.make_url('')), 'bucket', session=client.session)
+        return storage, app['objects']
+    return create
+
+
+@pytest.fixture
+def local_storage(tmpdir):
+    return LocalStorage(ImageStorage(location=str(tmpdir)), concurrency=2)
+
+
+async def test_local_storage(local_storage):
+    storage = local_storage
+    name, _ = await storage.save_hashed('a.png', io.BytesIO(DATA))
+    assert await storage.exists(name)
+    assert await storage.read(name) == DATA
+
+    rendition = os.path.join('CACHE', os.path.splitext(name)[0], '150x150.png')
+    await storage.write(rendition, b'1')
+    assert await storage.read(rendition) == b'1'
+    await storage.delete_dir(os.path.dirname(rendition))
+    assert not await storage.exists(rendition)
+
+    linked = await storage.get_available_name('b.png')
+    await storage.link(name, linked)
+    await storage.delete(name)
+    assert not await storage.exists(name)
+    assert await storage.read(linked) == DATA
+
+
+async def test_object_storage(object_storage):
+    storage, objects = await object_storage()
+    name = await storage.save('a.png', io.BytesIO(DATA))
+    assert name.startswith('image/') and name.endswith('.png')
+    assert objects[name] == DATA
+    assert await storage.exists(name)
+    assert await storage.read(name) == DATA
+
+    linked = await storage.get_available_name('b.png')
+    await storage.link(name, linked)
+    assert objects[linked] == DATA
+
+    for i in ('150x150.png', '300x300.png'):
+        await storage.write('CACHE/' + name[:-4] + '/' + i, b'1')
+    await storage.delete_dir('CACHE/' + name[:-4])
+    assert sorted(objects) == sorted([name, linked])
+
+    await storage.delete(name)
+    assert not await storage.exists(name)
+    with pytest.raises(FileNotFoundError):
+        await storage.read(name)
+
+
+async def test_object_storage_auth(object_storage):
+    storage, objects = await object_storage()
+    signed = []
+
+    def auth(method, url, headers):
+        signed.append((method, url, headers['x-amz-content-sha256']))
+        return headers
+
+    storage.auth = auth
+    await storage.write('CACHE/a/1.png', b'1')
+    assert signed[-1] == (
+        'PUT', storage.get_url('CACHE/a/1.png'), hashlib.sha256(b'1').hexdigest())
+    assert await storage.list('CACHE/a/') == ['CACHE/a/1.png']
+    assert signed[-1][1] == storage.get_url() + '?list-type=2&prefix=CACHE%2Fa%2F'
+    assert signed[-1][2] == hashlib.sha256(b'').hexdigest()
+
+
+async def test_close_storage(loop, monkeypatch):
+    storage = ObjectStorage('http://localhost', 'bucket')
+    session = storage.get_session()
+    monkeypatch.setattr(astorages, 'storage', storage)
+    await astorages.close_storage(None)
+    assert session.closed
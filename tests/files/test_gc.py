@@ -0,0 +1,47 @@
+import asyncio
+import uuid
+
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+
+from dvhb_hybrid.files import gc, image
+
+
+class Row:
+    def __init__(self, name):
+        self.image = name
+        self.uuid = uuid.uuid4()
+
+
+def test_list_rendition_dirs(tmpdir):
+    uid = uuid.uuid4()
+    tmpdir.join('image', 'ab', 'cd', str(uid), '150x150.jpg').ensure()
+    tmpdir.join('image', 'ab', 'cd', 'other', '150x150.jpg').ensure()
+    assert gc.list_rendition_dirs(str(tmpdir)) == [
+        (uid, str(tmpdir.join('image', 'ab', 'cd', str(uid))))]
+
+
+async def test_collect(loop, mocker):
+    app = mocker.Mock(loop=loop)
+    app.models.image.delete_where = mocker.Mock(
+        side_effect=asyncio.coroutine(lambda *args: None))
+    deleted = []
+    mocker.patch.object(
+        image, 'delete_image_files', asyncio.coroutine(deleted.append))
+
+    rows = [Row('image/{}.jpg'.format(i)) for i in range(3)]
+    collector = gc.ImageCollector(app, [], concurrency=2, dry_run=False)
+    collector.get_referenced = asyncio.coroutine(
+        lambda names, uuids: {'image/0.jpg', str(rows[1].uuid)})
+
+    await collector.collect(rows)
+    assert deleted == ['image/2.jpg']
+    assert collector.stats['scanned'] == 3
+    assert collector.stats['deleted'] == 1
+    assert app.models.image.delete_where.called
+
+
+def test_references_required(settings):
+    settings.FILES_GC_REFERENCES = []
+    with pytest.raises(ImproperlyConfigured):
+        gc.get_references()
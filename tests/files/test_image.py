@@ -0,0 +1,128 @@
+import asyncio
+import types
+
+import pytest
+from aiohttp.test_utils import make_mocked_request
+from django.conf import settings
+from PIL import features
+
+from dvhb_hybrid.files import image
+
+
+@pytest.mark.parametrize('accept,expected', [
+    (None, None),
+    ('*/*', None),
+    ('image/webp,image/*,*/*;q=0.8', 'WEBP'),
+    ('image/avif,image/webp,*/*', 'AVIF'),
+    ('image/webp;q=0, image/*', None),
+])
+def test_negotiate_format(monkeypatch, accept, expected):
+    monkeypatch.setattr(image, 'output_formats', ['AVIF', 'WEBP'])
+    headers = {'Accept': accept} if accept else {}
+    request = make_mocked_request('GET', '/', headers=headers)
+    assert image.negotiate_format(request) == expected
+
+
+@pytest.mark.skipif(not features.check('webp'), reason='Pillow without WebP')
+def test_output_formats(monkeypatch):
+    monkeypatch.setattr(image, 'output_formats', None)
+    monkeypatch.setattr(settings, 'FILES_RESIZE_FORMATS', ['webp', 'bogus'], raising=False)
+    assert image.get_output_formats() == ['WEBP']
+
+
+async def test_resize_error(loop, monkeypatch):
+    photo = types.SimpleNamespace(
+        name='image/a.jpg', renditions={}, mime_type='image/jpeg')
+
+    async def exists(loop, name):
+        return False
+
+    async def broken(*args):
+        raise OSError('Broken image')
+
+    monkeypatch.setattr(image, 'cache', None)
+    monkeypatch.setattr(image, 'image_factory', types.SimpleNamespace(
+        get_resized_name=lambda photo, w, h, fmt: 'cache/a.jpg'))
+    monkeypatch.setattr(image, 'rendition_index', types.SimpleNamespace(exists=exists))
+    monkeypatch.setattr(image, 'submit_resize', broken)
+    image.get_cache().set('uid', photo)
+    errors = image.PHOTO_RESIZE_ERROR.value
+    request = make_mocked_request('GET', '/')
+    assert await image.get_resized_image(request, 'uid', 10, 10) is None
+    assert image.PHOTO_RESIZE_ERROR.value == errors + 1
+    # Failure is cached, next request is not found without resizing
+    assert image.get_cache().get(('uid', 10, 10, None)) is None
+
+
+async def test_photo_fallback_and_missing_file(loop, monkeypatch, tmpdir):
+    uid = 'a2d2f5ab-3df6-4e4c-8d4e-2b2f1b1d3c55'
+    photo = types.SimpleNamespace(name='image/a.jpg', mime_type='image/jpeg')
+    tmpdir.join('image', 'a.jpg').ensure()
+
+    async def overloaded(*args):
+        e = image.ResizerOverloaded()
+        e.photo = photo
+        raise e
+
+    async def exists(name):
+        return tmpdir.join(name).exists()
+
+    monkeypatch.setattr(image, 'cache', None)
+    monkeypatch.setattr(image, 'resolve_image', overloaded)
+    monkeypatch.setattr(image, 'record_access', lambda app, name: accessed.append(name))
+    monkeypatch.setattr(image, 'get_storage', lambda: types.SimpleNamespace(
+        local=True, exists=exists, path=lambda name: str(tmpdir.join(name))))
+    monkeypatch.setattr(settings, 'FILES_SERVE_MODE', image.SERVE_FILE, raising=False)
+    monkeypatch.setattr(settings, 'FILES_RESIZE_OVERLOAD', image.OVERLOAD_ORIGIN, raising=False)
+    accessed = []
+    request = make_mocked_request('GET', '/')
+    r = await image.photo_handler(request, uid, 10, 10, False)
+    assert r.headers['Cache-Control'] == image.CACHE_CONTROL_FALLBACK
+    assert not accessed
+
+    # Rendition deleted behind our back
+    key = (uid, 20, 20, None)
+    image.get_cache().set(key, (settings.MEDIA_URL + 'CACHE/b.jpg', 'image/jpeg'))
+    with pytest.raises(image.web.HTTPNotFound):
+        await image.photo_handler(request, uid, 20, 20, False)
+    assert image.get_cache().get(key) is image.MISSING
+
+
+async def test_pruned_marker_without_budget(loop, monkeypatch, tmpdir):
+    cache = image.RenditionCache(str(tmpdir), 'CACHE/images')
+    cache.mark_pruned()
+    index = types.SimpleNamespace(clear=lambda: cleared.append(True))
+    cleared = []
+    monkeypatch.setattr(image, 'rendition_cache', cache)
+    monkeypatch.setattr(image, 'rendition_index', index)
+    monkeypatch.setattr(image, 'get_storage', lambda: types.SimpleNamespace(local=True))
+    monkeypatch.setattr(image, 'maintenance', {
+        'started_at': 0, 'pruned_at': 0, 'future': None})
+    app = types.SimpleNamespace(loop=loop)
+    image.record_access(app, 'CACHE/images/a.jpg')
+    await image.maintenance['future']
+    await asyncio.sleep(0, loop=loop)
+    assert cleared
+    assert not image.rendition_access
+
+
+async def test_remote_resize_overloaded(loop, monkeypatch):
+    photo = types.SimpleNamespace(
+        name='image/a.jpg', renditions={}, mime_type='image/jpeg')
+
+    async def exists(loop, name):
+        return False
+
+    async def overloaded(*args):
+        raise image.ResizerOverloaded()
+
+    monkeypatch.setattr(image, 'cache', None)
+    monkeypatch.setattr(image, 'image_factory', types.SimpleNamespace(
+        get_resized_name=lambda photo, w, h, fmt: 'cache/a.jpg'))
+    monkeypatch.setattr(image, 'rendition_index', types.SimpleNamespace(exists=exists))
+    monkeypatch.setattr(image, 'submit_resize', overloaded)
+    image.get_cache().set('uid', photo)
+    request = make_mocked_request('GET', '/')
+    with pytest.raises(image.ResizerOverloaded) as e:
+        await image.get_resized_image(request, 'uid', 10, 10)
+    assert e.value.photo is photo
@@ -0,0 +1,108 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from dvhb_hybrid.files import image_processors
+
+NAME = 'image/ab/cd/abcd1234-aaaa-4bbb-8ccc-123456789012.jpg'
+
+
+class Source:
+    name = NAME
+
+
+@pytest.fixture
+def source(tmpdir):
+    path = tmpdir.join(NAME)
+    path.dirpath().ensure(dir=True)
+    Image.new('RGB', size=(640, 480), color=(155, 0, 0)).save(str(path), 'jpeg')
+    return str(tmpdir)
+
+
+def test_cachefile_name():
+    factory = image_processors.ImageFactory()
+    generator = factory.get_generator(150, 150)(source=Source())
+    assert factory.get_cachefile_name(NAME, 150, 150) == generator.cachefile_name
+
+
+@pytest.mark.parametrize('size', [(150, 150), (300, 300), (1000, 100)])
+def test_resize_pillow(source, size):
+    factory = image_processors.ImageFactory(engine=image_processors.ENGINE_PILLOW)
+    factory.resize_to_cache(NAME, *size, root=source)
+    name = factory.get_resized_name(Source(), *size)
+    with Image.open(os.path.join(source, name)) as img:
+        assert img.size == size
+        assert img.format == 'JPEG'
+
+
+def test_resize_data(source):
+    factory = image_processors.ImageFactory(engine=image_processors.ENGINE_PILLOW)
+    with open(os.path.join(source, NAME), 'rb') as f:
+        data = factory.resize_data(f.read(), 150, 100, format='PNG')
+    with Image.open(io.BytesIO(data)) as img:
+        assert img.size == (150, 100)
+        assert img.format == 'PNG'
+
+
+def test_image_renditions():
+    row = {'image': NAME, 'mime_type': 'image/jpeg', 'meta': {'renditions': ['150x150']}}
+    photo = image_processors.Image(row)
+    assert image_processors.rendition_key(150, 150) in photo.renditions
+    row['meta'] = None
+    assert not image_processors.Image(row).renditions
+
+
+async def test_generate_renditions(app, source, monkeypatch):
+    from django.conf import settings
+    from dvhb_hybrid.files import image
+    from dvhb_hybrid.files.resizer import Resizer
+
+    factory = image_processors.ImageFactory(engine=image_processors.ENGINE_PILLOW)
+    resizer = Resizer(workers=1)
+    monkeypatch.setattr(image, 'image_factory', factory)
+    monkeypatch.setattr(image, 'resizer', resizer)
+    monkeypatch.setattr(settings, 'MEDIA_ROOT', source, raising=False)
+    eager = image.PHOTO_RESIZE_EAGER.value
+    photo = image_processors.Image({'image': NAME, 'mime_type': 'image/jpeg', 'meta': {}})
+    try:
+        keys = await image.generate_renditions(app, photo, [(150, 150), (300, 300)])
+    finally:
+        resizer.shutdown()
+    assert keys == ['150x150', '300x300']
+    assert image.PHOTO_RESIZE_EAGER.value == eager + 2
+    for w, h in (150, 150), (300, 300):
+        assert os.path.exists(os.path.join(source, factory.get_resized_name(photo, w, h)))
+
+
+@pytest.mark.parametrize('format,ext', [('WEBP', '.webp'), ('JPEG', '.jpg')])
+def test_resize_format(source, format, ext):
+    factory = image_processors.ImageFactory(
+        engine=image_processors.ENGINE_PILLOW, quality={'webp': 60})
+    assert factory.get_quality(NAME, format) == (60 if format == 'WEBP' else 70)
+    factory.resize_to_cache(NAME, 150, 150, source, format)
+    name = factory.get_resized_name(Source(), 150, 150, format)
+    assert name.endswith('150x150' + ext)
+    assert name == image_processors.ImageFactory().get_resized_name(Source(), 150, 150, format)
+    with Image.open(os.path.join(source, name)) as img:
+        assert img.format == format
+
+
+def test_extract_meta(tmpdir):
+    path = tmpdir.join(NAME)
+    path.dirpath().ensure(dir=True)
+    exif = Image.Exif()
+    exif[image_processors.EXIF_ORIENTATION] = 6
+    Image.new('RGB', size=(640, 480)).save(str(path), 'jpeg', exif=exif)
+    meta = image_processors.ImageFactory().extract_meta(NAME, str(tmpdir))
+    assert meta['width'] == 480
+    assert meta['height'] == 640
+    assert meta['format'] == 'JPEG'
+    assert meta['orientation'] == 6
+    assert meta['placeholder'].startswith('data:image/jpeg;base64,')
+
+    factory = image_processors.ImageFactory(engine=image_processors.ENGINE_PILLOW)
+    factory.resize_to_cache(NAME, 300, 100, str(tmpdir))
+    with Image.open(str(tmpdir.join(factory.get_resized_name(Source(), 300, 100)))) as img:
+        assert img.size == (300, 100)
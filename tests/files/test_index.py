@@ -0,0 +1,28 @@
+from dvhb_hybrid.files.index import FileIndex
+
+PREFIX = 'CACHE/images'
+NAME = PREFIX + '/image/ab/cd/abcd/150x150.jpg'
+
+
+async def test_index(loop, tmpdir):
+    index = FileIndex(str(tmpdir), PREFIX)
+    assert not await index.exists(loop, NAME)
+    assert index.stats == 1
+
+    tmpdir.join(NAME).ensure()
+    assert await index.exists(loop, NAME)
+    assert await index.exists(loop, NAME)
+    assert index.stats == 2
+    assert index.hits == 1
+
+    index.discard(NAME)
+    assert NAME not in index
+
+
+async def test_index_load(loop, tmpdir):
+    tmpdir.join(NAME).ensure()
+    tmpdir.join(PREFIX, 'image', 'x.jpg.tmp').ensure()
+    index = FileIndex(str(tmpdir), PREFIX)
+    await index.load(loop)
+    assert len(index) == 1
+    assert NAME in index
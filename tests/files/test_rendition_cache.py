@@ -0,0 +1,50 @@
+import os
+
+from dvhb_hybrid.files.rendition_cache import RenditionCache
+
+PREFIX = 'CACHE/images'
+
+
+def make(tmpdir, name, size):
+    path = tmpdir.join(PREFIX, 'image', name)
+    path.ensure()
+    path.write(b'x' * size)
+    return os.path.relpath(str(path), str(tmpdir))
+
+
+def test_prune(tmpdir):
+    names = [make(tmpdir, '{}x{}.jpg'.format(i, i), 100) for i in range(1, 6)]
+    cache = RenditionCache(str(tmpdir), PREFIX, budget=300, keep={'1x1'})
+    assert cache.sync() == (5, 0)
+    assert cache.report()['size'] == 500
+    # Oldest first, 1x1 is kept
+    cache.touch({name: i for i, name in enumerate(names)})
+    cache.touch({names[1]: 10})
+
+    deleted, freed = cache.prune(dry_run=True)
+    assert deleted == names[2:5]
+    assert cache.pruned_at() is None
+
+    deleted, freed = cache.prune()
+    assert freed == 300
+    assert not tmpdir.join(names[2]).exists()
+    assert tmpdir.join(names[1]).exists()
+    assert cache.report()['count'] == 2
+    assert cache.pruned_at()
+    assert cache.prune() == ([], 0)
+
+
+def test_originals_are_not_pruned(tmpdir):
+    original = tmpdir.join('image', 'ab', 'cd', 'a.jpg')
+    original.ensure()
+    original.write(b'x' * 1000)
+    name = make(tmpdir, '10x10.jpg', 100)
+    cache = RenditionCache(str(tmpdir), PREFIX, budget=50)
+    cache.touch({'image/ab/cd/a.jpg': 1, PREFIX + '/../image/ab/cd/a.jpg': 2, name: 3})
+    assert cache.report()['count'] == 1
+    with cache.connect() as conn:
+        # Recorded before names were checked
+        conn.execute('INSERT INTO rendition VALUES (?, ?, ?)', ('image/ab/cd/a.jpg', 1000, 0))
+    assert cache.prune() == ([name], 100)
+    assert original.exists()
+    assert cache.report()['count'] == 0
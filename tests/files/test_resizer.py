@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from dvhb_hybrid.files.resizer import Resizer, ResizerOverloaded
+
+
+def crash():
+    os._exit(1)
+
+
+@pytest.fixture
+def resizer():
+    r = Resizer(workers=1, queue_size=1)
+    yield r
+    r.shutdown()
+
+
+async def test_resizer(loop, resizer):
+    assert await resizer.submit(loop, pow, 2, 10) == 1024
+    assert resizer.pending == 0
+
+
+async def test_resizer_overload(loop, resizer):
+    futures = [resizer.submit(loop, pow, 2, i) for i in range(2)]
+    assert resizer.pending == 2
+    assert resizer.queued == 1
+    with pytest.raises(ResizerOverloaded):
+        resizer.submit(loop, pow, 2, 3)
+    assert resizer.overload_counter == 1
+    for f in futures:
+        await f
+    assert resizer.pending == 0
+
+
+async def test_resizer_broken(loop, resizer):
+    with pytest.raises(Exception):
+        await resizer.submit(loop, crash)
+    assert resizer.broken_counter == 1
+    # New pool is created
+    assert await resizer.submit(loop, pow, 2, 2) == 4
@@ -0,0 +1,56 @@
+import hashlib
+import io
+import os
+
+from dvhb_hybrid.files import storages
+from dvhb_hybrid.files.storages import ImageStorage
+
+DATA = b'\x89PNG\r\n\x1a\n' + bytes(100)
+
+
+def test_save_hashed(tmpdir):
+    storage = ImageStorage(location=str(tmpdir))
+    name, digest = storage.save_hashed('a.png', io.BytesIO(DATA))
+    assert digest == hashlib.sha256(DATA).hexdigest()
+    assert storage.open(name).read() == DATA
+
+
+def test_link(tmpdir):
+    storage = ImageStorage(location=str(tmpdir))
+    source = storage.save('a.png', io.BytesIO(DATA))
+    name = storage.get_available_name('b.png')
+    storage.link(source, name)
+    assert os.path.samefile(storage.path(source), storage.path(name))
+    storage.delete(source)
+    assert storage.open(name).read() == DATA
+
+
+def test_precreated_shards(tmpdir, monkeypatch, mocker):
+    monkeypatch.setattr(
+        storages.settings, 'FILES_PRECREATE_SHARDS', True, raising=False)
+    storage = ImageStorage(location=str(tmpdir))
+    shard = os.path.join('image', 'ab', 'cd')
+    mocker.patch.object(storage, 'get_shards', return_value=[shard])
+    exists = mocker.patch.object(storage, 'exists', return_value=False)
+
+    # Save does not create directories of all shards
+    storage.save('c.png', io.BytesIO(DATA))
+    assert not tmpdir.join('image', '.shards').check()
+    assert storage.create_shards()
+    assert not storage.create_shards()
+    assert tmpdir.join('image', '.shards').check()
+
+    # Name with uuid is checked
+    exists.reset_mock()
+    name = storage.save(
+        'abcd1234-aaaa-4bbb-8ccc-123456789012.png', io.BytesIO(DATA))
+    assert name.startswith(shard)
+    assert exists.called
+    assert storage.is_known_dir(storage.path(shard))
+    assert storage.open(name).read() == DATA
+
+    # Fresh uuid is not checked, missing shard directory is created
+    exists.reset_mock()
+    name = storage.save('b.png', io.BytesIO(DATA))
+    assert not exists.called
+    assert storage.open(name).read() == DATA
@@ -0,0 +1,153 @@
+import asyncio
+import types
+
+import pytest
+
+from dvhb_hybrid.mailer.asmtp import SMTPConnection, SMTPError
+
+
+class Sink:
+    """Local SMTP server keeping received messages"""
+    def __init__(self, pipelining=True):
+        self.pipelining = pipelining
+        self.messages = []
+        self.commands = []
+        self.connections = 0
+        self.server = None
+        self.writers = []
+
+    async def start(self, loop):
+        self.server = await asyncio.start_server(
+            self.handle, '127.0.0.1', 0, loop=loop)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.drop()
+        self.server.close()
+        await self.server.wait_closed()
+
+    def drop(self):
+        for writer in self.writers:
+            writer.close()
+        self.writers = []
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        self.writers.append(writer)
+        writer.write(b'220 sink ready\r\n')
+        envelope = []
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            command = line.decode().strip()
+            self.commands.append(command.split(' ')[0])
+            verb = command[:4].upper()
+            if verb == 'EHLO':
+                writer.write(b'250-sink\r\n')
+                if self.pipelining:
+                    writer.write(b'250-PIPELINING\r\n')
+                writer.write(b'250 8BITMIME\r\n')
+            elif verb == 'MAIL':
+                envelope = [command]
+                writer.write(b'250 OK\r\n')
+            elif verb == 'RCPT':
+                if 'reject' in command:
+                    writer.write(b'550 No such user\r\n')
+                else:
+                    envelope.append(command)
+                    writer.write(b'250 OK\r\n')
+            elif verb == 'DATA' and len(envelope) < 2:
+                writer.write(b'554 No valid recipients\r\n')
+            elif verb == 'DATA':
+                writer.write(b'354 Go ahead\r\n')
+                data = await reader.readuntil(b'\r\n.\r\n')
+                self.messages.append((envelope, data))
+                writer.write(b'250 Queued\r\n')
+            elif verb == 'QUIT':
+                writer.write(b'221 Bye\r\n')
+                writer.close()
+                break
+            else:
+                writer.write(b'250 OK\r\n')
+
+
+def get_message(mail_to, body='Test body'):
+    return types.SimpleNamespace(
+        pk=None, mail_to=[mail_to], subject='Тест', body=body)
+
+
+async def make_connection(loop, sink, **mta):
+    port = await sink.start(loop)
+    mta.update(host='127.0.0.1', port=port, timeout=5)
+    conf = types.SimpleNamespace(mta=mta, from_email='no-reply@example.com')
+    conf.get = lambda key, default=None: getattr(conf, key, default)
+    return SMTPConnection(loop=loop, conf=conf)
+
+
+@pytest.mark.parametrize('pipelining', [True, False])
+async def test_send_messages(loop, pipelining):
+    sink = Sink(pipelining)
+    conn = await make_connection(loop, sink)
+    async with conn:
+        assert conn.pipelining is pipelining
+        await conn.send_message(get_message('a@example.com', 'Line\n.dot'))
+        await conn.send_message(get_message('b@example.com'))
+    await conn.close()
+    await sink.stop()
+    assert len(sink.messages) == 2
+    envelope, data = sink.messages[0]
+    assert envelope == ['MAIL FROM:<no-reply@example.com>', 'RCPT TO:<a@example.com>']
+    assert b'\r\n..dot\r\n.\r\n' in data
+    assert sink.commands[-1] == 'QUIT'
+
+
+async def test_rejected_recipient(loop):
+    sink = Sink()
+    conn = await make_connection(loop, sink)
+    async with conn:
+        with pytest.raises(SMTPError) as e:
+            await conn.send_message(get_message('reject@example.com'))
+        assert e.value.code == 550
+        await conn.send_message(get_message('a@example.com'))
+        message = get_message('a@example.com')
+        message.mail_to = []
+        with pytest.raises(ValueError):
+            await conn.send_message(message)
+    await conn.close()
+    await sink.stop()
+    assert len(sink.messages) == 1
+    assert 'RSET' in sink.commands
+
+
+async def test_reuse_and_probe(loop):
+    sink = Sink()
+    conn = await make_connection(loop, sink, keepalive=0.05)
+    for i in range(3):
+        async with conn:
+            await conn.send_message(get_message('a@example.com'))
+    assert sink.connections == 1
+    # Idle connection is probed
+    await asyncio.sleep(0.12, loop=loop)
+    assert 'NOOP' in sink.commands
+    # Connection dropped by server is opened again
+    sink.drop()
+    await asyncio.sleep(0.01, loop=loop)
+    async with conn:
+        await conn.send_message(get_message('a@example.com'))
+    await conn.close()
+    await sink.stop()
+    assert sink.connections == 2
+    assert len(sink.messages) == 4
+
+
+async def test_without_keepalive(loop):
+    sink = Sink()
+    conn = await make_connection(loop, sink, keepalive=None)
+    for i in range(2):
+        async with conn:
+            await conn.send_message(get_message('a@example.com'))
+    await conn.close()
+    await sink.stop()
+    assert sink.connections == 1
+    assert sink.commands.count('NOOP') == 1
@@ -6,7 +6,7 @@ import pytest
 import sqlalchemy as sa
 
 from dvhb_hybrid import exceptions
-from dvhb_hybrid.amodels import Model
+from dvhb_hybrid.amodels import AppModels, Model
 
 
 @pytest.fixture
@@ -190,3 +190,14 @@ async def test_validate_and_save(app, new_object):
     # Valid update
     o = await m.get_one(o.pk, fields=['id'])
     await o.validate_and_save({})
+
+
+def test_warm_up():
+    app = {}
+    models = AppModels(app)
+    timings = models.warm_up()
+    assert 'model1' in timings
+    # Abstract base model has no table
+    assert 'model' not in timings
+    assert 'model1' in vars(models)
+    assert models.model1.app is app
@@ -0,0 +1,102 @@
+import datetime
+import json
+import uuid
+
+import pytest
+from aiohttp import web
+
+from dvhb_hybrid import aviews
+
+
+@pytest.fixture
+def data():
+    return {
+        'id': 1,
+        'uuid': uuid.uuid4(),
+        'created_at': datetime.datetime(2018, 1, 2, 3, 4, 5, 678),
+        'date': datetime.date(2018, 1, 2),
+        'tags': {'a'},
+        'name': 'Имя',
+        'items': [{'x': None, 'y': 1.5}],
+    }
+
+
+@pytest.mark.parametrize('backend', sorted(aviews.json_backends))
+def test_json_backends(backend, data):
+    expected = aviews.dumps_json(data)
+    result = aviews.json_backends[backend](data)
+    assert json.loads(result) == json.loads(expected)
+    assert 'Имя' in result
+
+
+def test_set_json_backend(data, monkeypatch):
+    # Restore current backend after test
+    monkeypatch.setattr(aviews, '_dumps', aviews._dumps)
+    aviews.set_json_backend('json')
+    assert aviews.dumper(data) == aviews.dumps_json(data)
+    with pytest.raises(KeyError):
+        aviews.set_json_backend('unknown')
+
+
+class AsyncItems:
+    def __init__(self, n):
+        self.items = iter(range(n))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return {'id': next(self.items)}
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+async def stream_handler(request):
+    n = int(request.query.get('n', 0))
+    return await aviews.stream_json(
+        request, AsyncItems(n), buffer_size=100,
+        ndjson='ndjson' in request.query)
+
+
+async def test_stream_json(test_client, loop):
+    app = web.Application(loop=loop)
+    app.router.add_get('/stream', stream_handler)
+    client = await test_client(app)
+
+    for n in (0, 1, 1000):
+        r = await client.get('/stream', params={'n': n})
+        assert r.status == 200
+        assert await r.json() == [{'id': i} for i in range(n)]
+
+    r = await client.get('/stream', params={'n': 3, 'ndjson': ''})
+    assert r.status == 200
+    lines = (await r.text()).splitlines()
+    assert [json.loads(i) for i in lines] == [{'id': i} for i in range(3)]
+
+
+async def test_file_response(test_client, loop, tmpdir):
+    path = tmpdir.join('a.jpg')
+    path.write(b'0123456789')
+
+    async def handler(request):
+        return aviews.file_response(
+            str(path), 'image/jpeg', headers={'Cache-Control': 'max-age=60'})
+
+    app = web.Application(loop=loop)
+    app.router.add_get('/', handler)
+    client = await test_client(app)
+
+    r = await client.get('/')
+    assert r.status == 200
+    assert r.headers['Content-Type'] == 'image/jpeg'
+    assert r.headers['Cache-Control'] == 'max-age=60'
+    assert await r.read() == b'0123456789'
+
+    r = await client.get('/', headers={'Range': 'bytes=2-4'})
+    assert r.status == 206
+    assert await r.read() == b'234'
+
+    last_modified = r.headers['Last-Modified']
+    r = await client.get('/', headers={'If-Modified-Since': last_modified})
+    assert r.status == 304
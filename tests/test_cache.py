@@ -0,0 +1,101 @@
+import asyncio
+import uuid
+
+import aioredis
+import pytest
+from aiohttp import web
+
+from dvhb_hybrid import cache
+
+
+async def redis_close(app):
+    pool = app['redis']
+    pool.close()
+    await pool.wait_closed()
+
+
+async def test_cached_response(loop, test_client):
+    app = web.Application(loop=loop)
+    app.name = 'dvhb_hybrid:test:{}'.format(uuid.uuid4())
+    app['redis'] = await aioredis.create_pool(
+        ('localhost', 6379), loop=loop)
+    app.on_shutdown.append(redis_close)
+    calls = []
+
+    @cache.cached_response(60, vary_on=[cache.VARY_QUERY], tags=['test'])
+    async def handler(request):
+        calls.append(request.query.get('q'))
+        await asyncio.sleep(0.1, loop=loop)
+        return {'q': request.query.get('q')}
+
+    app.router.add_get('/test', handler)
+    client = await test_client(app)
+
+    responses = await asyncio.gather(
+        *[client.get('/test', params={'q': '1'}) for _ in range(5)],
+        loop=loop)
+    for r in responses:
+        assert r.status == 200
+        assert await r.json() == {'q': '1'}
+    # Concurrent misses wait for single call
+    assert calls == ['1']
+
+    r = await client.get('/test', params={'q': '2'})
+    assert await r.json() == {'q': '2'}
+    assert calls == ['1', '2']
+
+    await cache.invalidate_tags(app, 'test')
+    r = await client.get('/test', params={'q': '1'})
+    assert await r.json() == {'q': '1'}
+    assert calls == ['1', '2', '1']
+
+
+async def test_conditional(loop, test_client):
+    app = web.Application(loop=loop)
+    calls = []
+
+    @cache.conditional(lambda request: '"v1"')
+    async def handler(request):
+        calls.append(1)
+        return {'x': 1}
+
+    app.router.add_get('/test', handler)
+    client = await test_client(app)
+
+    r = await client.get('/test')
+    assert r.status == 200
+    assert r.headers['ETag'] == '"v1"'
+    assert await r.json() == {'x': 1}
+
+    r = await client.get('/test', headers={'If-None-Match': 'W/"v0", W/"v1"'})
+    assert r.status == 304
+    assert calls == [1]
+
+
+async def test_batch_loader(loop):
+    calls = []
+
+    async def load(keys):
+        calls.append(sorted(keys))
+        return {k: k * 2 for k in keys if k != 3}
+
+    loader = cache.BatchLoader(load, delay=0.01, max_size=3, loop=loop)
+    futures = [loader.get(i) for i in (1, 2, 1)]
+    assert futures[0] is futures[2]
+    assert await asyncio.gather(*futures) == [2, 4, 2]
+    assert calls == [[1, 2]]
+
+    # Full batch is loaded without delay
+    futures = [loader.get(i) for i in (3, 4, 5, 6)]
+    assert await asyncio.gather(*futures) == [None, 8, 10, 12]
+    assert calls[1:] == [[3, 4, 5], [6]]
+
+
+async def test_batch_loader_cancel(loop):
+    async def load(keys):
+        raise asyncio.CancelledError()
+
+    loader = cache.BatchLoader(load, delay=0, loop=loop)
+    f = loader.get(1)
+    with pytest.raises(asyncio.CancelledError):
+        await f
@@ -1,4 +1,6 @@
 import asyncio
+import collections
+import types
 
 import pytest
 from django.core import mail
@@ -14,3 +16,120 @@ async def test_mailer(app,  cli):
     await asyncio.sleep(1, loop=app.loop)
     assert app.mailer.running()
     assert len(mail.outbox) == 1
+
+
+async def test_mailer_workers(loop, test_client):
+    from aiohttp import web
+    from dvhb_hybrid.mailer.dummy import Mailer
+
+    app = web.Application(loop=loop)
+    Mailer.setup(app, {
+        'cls': 'dvhb_hybrid.mailer.dummy.Mailer',
+        'from_email': 'no-replay@dvhb.ru',
+        'workers': 4,
+        'latency': 0.01,
+    })
+    await test_client(app)
+    app.mailer.clean()
+    for i in range(8):
+        app.mailer.queue.put_nowait(types.SimpleNamespace(
+            pk=None, mail_to=['user{}@example.com'.format(i)],
+            subject='Test mailer', body='Test body'))
+    await app.mailer.queue.join()
+    assert len(app.mailer.messages) == 8
+    sent = [c['success'] for c in app.mailer.worker_counters]
+    assert sum(sent) == 8
+    assert all(i >= 1 for i in sent)
+
+
+@pytest.mark.django_db
+async def test_mailer_outbox(app, cli):
+    from dvhb_hybrid.mailer.dummy import Connection
+
+    await cli()
+    model = app.m.mail_message
+    messages = []
+    for i in range(3):
+        messages.append(await model.create(
+            mail_to=['user{}@example.com'.format(i)],
+            subject='Test outbox', body='Test body'))
+    pks = [i.pk for i in messages]
+    app.mailer.batch_size = 2
+    Connection.messages = []
+
+    # Row locked by another worker is skipped
+    async with app['db'].acquire() as db:
+        async with db.begin():
+            claimed = await model.claim_unsent(1, 5, connection=db)
+            assert claimed[0].pk == pks[0]
+            counter = collections.Counter()
+            conn = Connection(conf=app.mailer.conf)
+            assert await app.mailer.send_outbox(conn, counter) == 2
+            assert counter['success'] == 2
+
+    assert await app.mailer.send_outbox(conn, counter) == 1
+    assert await app.mailer.send_outbox(conn, counter) == 0
+    assert len(Connection.messages) == 3
+    sent = await model.get_list(model.table.c.id.in_(pks))
+    assert all(i.sent_at for i in sent)
+
+
+@pytest.mark.django_db
+async def test_mailer_send_chunks(app, cli):
+    from dvhb_hybrid.mailer.dummy import Connection
+
+    await cli()
+    model = app.m.mail_message
+    app.mailer.batch_size = 2
+    Connection.messages = []
+    mail_to = ['user{}@example.com'.format(i) for i in range(5)]
+    conn = Connection(conf=app.mailer.conf)
+    assert await app.mailer.send(mail_to, 'Test chunks', 'Hello {mail_to}', connection=conn) == 5
+    assert [i['To'] for i in Connection.messages] == mail_to
+    messages = await model.get_list(model.table.c.subject == 'Test chunks')
+    assert sorted(i.mail_to[0] for i in messages) == mail_to
+    assert all(i.sent_at for i in messages)
+
+
+@pytest.mark.django_db
+async def test_mailer_send_not_claimed(app, cli):
+    from dvhb_hybrid.mailer.dummy import Connection
+
+    await cli()
+    model = app.m.mail_message
+    claimed = []
+
+    class ClaimingConnection(Connection):
+        async def send_message(self, message):
+            # Outbox worker polls while message is being sent
+            async with app['db'].acquire() as db:
+                async with db.begin():
+                    claimed.extend(await model.claim_unsent(
+                        10, app.mailer.max_attempts, connection=db))
+            await super().send_message(message)
+
+    conn = ClaimingConnection(conf=app.mailer.conf)
+    await app.mailer.send('user@example.com', 'Test claim', 'Test body', connection=conn)
+    assert not [i for i in claimed if i.subject == 'Test claim']
+
+
+@pytest.mark.django_db
+async def test_mailer_send_interrupted(app, cli):
+    from dvhb_hybrid.mailer.dummy import Connection
+
+    await cli()
+    model = app.m.mail_message
+
+    class FailingConnection(Connection):
+        async def send_message(self, message):
+            if message.mail_to == ['fail@example.com']:
+                raise ConnectionError()
+            await super().send_message(message)
+
+    conn = FailingConnection(conf=app.mailer.conf)
+    mail_to = ['user@example.com', 'fail@example.com']
+    with pytest.raises(ConnectionError):
+        await app.mailer.send(mail_to, 'Test interrupted', 'Test body', connection=conn)
+    messages = await model.get_list(model.table.c.subject == 'Test interrupted')
+    assert {i.mail_to[0]: bool(i.sent_at) for i in messages} == {
+        'user@example.com': True, 'fail@example.com': False}
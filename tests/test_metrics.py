@@ -0,0 +1,53 @@
+from aiohttp import web
+
+from dvhb_hybrid import metrics
+from dvhb_hybrid.middleware.metrics import metrics_factory
+
+
+def test_expose():
+    registry = metrics.Registry()
+    registry.counter('requests', 'Requests').inc(2)
+    registry.gauge('size', 'Size', labelnames=['name']).labels('a"b').set(1.5)
+    histogram = registry.histogram('seconds', 'Time', buckets=[0.1, 1])
+    for i in 0.05, 0.5, 5:
+        histogram.observe(i)
+    assert registry.expose().splitlines() == [
+        '# HELP requests Requests',
+        '# TYPE requests counter',
+        'requests_total 2',
+        '# HELP size Size',
+        '# TYPE size gauge',
+        'size{name="a\\"b"} 1.5',
+        '# HELP seconds Time',
+        '# TYPE seconds histogram',
+        'seconds_bucket{le="0.1"} 1',
+        'seconds_bucket{le="1"} 2',
+        'seconds_bucket{le="+Inf"} 3',
+        'seconds_sum 5.55',
+        'seconds_count 3',
+    ]
+
+
+def test_collector():
+    registry = metrics.Registry()
+    gauge = registry.gauge('value')
+    registry.add_collector(lambda: gauge.set(42))
+    assert 'value 42' in registry.expose()
+    assert registry.counter('a') is registry.counter('a')
+
+
+async def test_metrics_handler(loop, test_client):
+    async def handler(request):
+        return web.Response(text='ok')
+
+    app = web.Application(loop=loop, middlewares=[metrics_factory])
+    app.router.add_get('/items/{id}', handler)
+    app.router.add_get('/metrics', metrics.metrics_handler)
+    client = await test_client(app)
+    response = await client.get('/items/1')
+    assert response.status == 200
+    response = await client.get('/metrics')
+    assert response.headers['Content-Type'] == metrics.CONTENT_TYPE
+    text = await response.text()
+    assert 'http_requests_total{endpoint="/items/{id}",method="GET",status="200"} 1' in text
+    assert 'http_request_duration_seconds_count{endpoint="/items/{id}",method="GET"} 1' in text
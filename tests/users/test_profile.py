@@ -48,3 +48,16 @@ async def test_patch_profile_successful(app, test_client, create_new_user, patch
     changed_data = await patch_profile_request(new_data, client=client, expected_status=200)
     assert changed_data['first_name'] == new_data['first_name']
     assert changed_data['last_name'] == new_data['last_name']
+
+
+@pytest.mark.django_db
+async def test_get_profile_not_modified(app, test_client, user):
+    client = await test_client(app)
+    await client.authorize(**user)
+    response = await client.get('dvhb_hybrid.user:profile')
+    assert response.status == 200
+    etag = response.headers['ETag']
+    response = await client.get('dvhb_hybrid.user:profile', headers={'If-None-Match': etag})
+    assert response.status == 304
+    response = await client.get('dvhb_hybrid.user:profile', headers={'If-None-Match': '"xxx"'})
+    assert response.status == 200